@@ -0,0 +1,81 @@
+import argparse
+import time
+
+import numba
+import torch
+
+from utils.metrics import kernels
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="time the weighted metrics of the torch and numba backends"
+    )
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--channels", type=int, default=69)
+    parser.add_argument("--nlat", type=int, default=721)
+    parser.add_argument("--nlon", type=int, default=1440)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=0,
+        help="threads of both backends (0: their defaults)",
+    )
+    return parser.parse_args()
+
+
+def timed(func, repeat):
+    """
+    Best wall time of ``repeat`` calls and the last result.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    args = parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+        numba.set_num_threads(args.threads)
+    shape = (args.batch, args.channels, args.nlat, args.nlon)
+    pred = torch.randn(shape)
+    gt = torch.randn(shape)
+    backends = {name: kernels(name) for name in ("torch", "numba")}
+
+    cases = {
+        "bias": lambda k: k.type_weighted_bias_torch(pred, metric_type="all"),
+        "activity": lambda k: k.type_weighted_activity_torch(pred, metric_type="all"),
+        "anomaly": lambda k: k.type_weighted_anomaly_torch(pred, gt, "all"),
+        "rmse": lambda k: k.type_weighted_rmse_torch(pred, gt, metric_type="all"),
+        "acc": lambda k: k.type_weighted_acc_torch(pred, gt, metric_type="all"),
+        "nrmse": lambda k: k.type_weighted_rmse_torch(pred, gt, "northern"),
+    }
+    # compile the kernels outside the timings
+    for case in cases.values():
+        case(backends["numba"])
+
+    print(
+        "%d x %d x %d x %d fields, %d torch / %d numba threads"
+        % (*shape, torch.get_num_threads(), numba.get_num_threads())
+    )
+    print(
+        "%-10s %12s %12s %9s %12s"
+        % ("metric", "torch (s)", "numba (s)", "speedup", "max diff")
+    )
+    for name, case in cases.items():
+        t_torch, r_torch = timed(lambda case=case: case(backends["torch"]), args.repeat)
+        t_numba, r_numba = timed(lambda case=case: case(backends["numba"]), args.repeat)
+        diff = (r_torch.double() - r_numba.double()).abs().max().item()
+        print(
+            "%-10s %12.4f %12.4f %9.2f %12.3g"
+            % (name, t_torch, t_numba, t_torch / t_numba, diff)
+        )
+
+
+if __name__ == "__main__":
+    main()
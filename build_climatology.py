@@ -0,0 +1,76 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+import torch
+
+from cyclic_da import data_reader, shared_resources
+from utils.climatology import Climatology
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="day-of-year by time-of-day ERA5 climatology of the 69 "
+        "channels, for the ACC and activity scores"
+    )
+    parser.add_argument("--start_time", type=str, default="1993-01-01 00:00:00")
+    parser.add_argument("--end_time", type=str, default="2016-12-31 18:00:00")
+    parser.add_argument(
+        "--step", type=int, default=6, help="hours between the states averaged"
+    )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        default="gcloud",
+        choices=["gcloud", "local", "s3"],
+        help="where the ERA5 states are read from",
+    )
+    parser.add_argument(
+        "--prefetch", type=int, default=2, help="states read ahead of the averaging"
+    )
+    parser.add_argument(
+        "--out",
+        type=str,
+        default="da_cycle_results/climatology",
+        help="directory of the climatology; an existing one is extended",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    model_std = torch.from_numpy(np.load("dataset/layer_std.npy")).float()
+    step = pd.Timedelta(hours=args.step)
+    reader = data_reader(
+        obs_type=None,
+        obs_std=0.0,
+        model_std=model_std,
+        da_win=1,
+        cycle_time=step,
+        step_int_time=step,
+        shared=shared_resources(),
+    )
+    read_state = {
+        "gcloud": reader.get_one_state_from_gcloud,
+        "local": reader.get_one_state_from_local,
+        "s3": reader.get_one_state_from_s3,
+    }[args.backend]
+
+    clim = Climatology(
+        args.out, shape=(len(model_std), 721, 1440), nhour=24 // args.step
+    )
+    clim.build(
+        lambda t: read_state(t, save_timestamp=False),
+        pd.Timestamp(args.start_time),
+        pd.Timestamp(args.end_time),
+        step,
+        prefetch=args.prefetch,
+    )
+    print(
+        "climatology of %d states in %d of %d slabs"
+        % (clim.count.sum(), (clim.count > 0).sum(), clim.count.size)
+    )
+
+
+if __name__ == "__main__":
+    main()
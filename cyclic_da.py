@@ -1,18 +1,34 @@
 import argparse
+import hashlib
 import io
+import itertools
+import multiprocessing
 import os
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import minio
 import numpy as np
 import onnxruntime
 import pandas as pd
 import torch
-import torch.optim as optim
+import torch.distributed as dist
 from environs import env
 from torch_harmonics import InverseRealSHT, RealSHT
 
-from utils.metrics import Metrics
+from utils import distributed as dist_utils
+from utils.cache import StateCache
+from utils.checkpoint import CheckpointWriter
+from utils.climatology import Climatology
+from utils.columnar import ColumnarLog
+from utils.error_maps import ErrorMaps
+from utils.letkf import letkf_weights, localize
+from utils.metrics import fused_scores
+from utils.minimizer import CurvaturePairs, build_minimizer
+from utils.obs_stats import obs_space_stats
+from utils.scores import ScoreStore
+from utils.telemetry import MinimizationTelemetry
+from utils.verification import VerificationWorker
 
 torch.cuda.empty_cache()
 
@@ -34,7 +50,7 @@ GCLOUD_BUCKET = env(
 env.read_env()
 
 
-def arg_parser():
+def arg_parser(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--start_time",
@@ -81,11 +97,117 @@ def arg_parser():
         type=int,
         default=3,
     )
+    parser.add_argument(
+        "--minimizer",
+        type=str,
+        default="lbfgs",
+        choices=["lbfgs", "cg", "lanczos"],
+    )
+    parser.add_argument(
+        "--max_iter",
+        type=int,
+        default=5,
+    )
+    parser.add_argument(
+        "--history_size",
+        type=int,
+        default=10,
+    )
+    parser.add_argument(
+        "--gtol",
+        type=float,
+        default=0.0,
+    )
+    parser.add_argument(
+        "--ftol",
+        type=float,
+        default=0.0,
+        help="relative cost reduction per iteration to stop at (0: off); cg and "
+        "lanczos measure it on their quadratic model of the cost",
+    )
+    parser.add_argument(
+        "--max_eval",
+        type=int,
+        default=0,
+        help="budget of cost evaluations and Hessian-vector products per "
+        "minimization (0: none)",
+    )
+    parser.add_argument(
+        "--max_time",
+        type=float,
+        default=0.0,
+    )
+    parser.add_argument(
+        "--mr_levels",
+        type=str,
+        default="",
+        help="coarse-to-fine schedule run before the full-resolution Nit "
+        "iterations, as comma-separated factor:iterations pairs, e.g. '4:2,2:1'; "
+        "a coarse level runs the forecast model once, from the state it starts "
+        "from",
+    )
+    parser.add_argument(
+        "--precond_pairs",
+        type=int,
+        default=0,
+        help="number of curvature pairs carried across cycles to precondition "
+        "the full-grid minimization (0: no preconditioning)",
+    )
+    parser.add_argument(
+        "--warm_start",
+        type=float,
+        default=0.0,
+        help="start each cycle from this multiple of the previous control "
+        "variable (0: start from zero)",
+    )
+    parser.add_argument(
+        "--outer_loops",
+        type=int,
+        default=1,
+        help="fgat outer loops, each re-running the trajectory from the current "
+        "analysis",
+    )
+    parser.add_argument(
+        "--wc_workers",
+        type=int,
+        default=0,
+        help="threads running the sub-window model integrations of wc4dvar "
+        "concurrently (0: one per sub-window)",
+    )
+    parser.add_argument(
+        "--ens_size",
+        type=int,
+        default=8,
+    )
+    parser.add_argument(
+        "--loc_radius",
+        type=int,
+        default=20,
+        help="letkf localization cutoff in grid points",
+    )
+    parser.add_argument(
+        "--inflation",
+        type=float,
+        default=1.1,
+    )
+    parser.add_argument(
+        "--letkf_workers",
+        type=int,
+        default=1,
+        help="threads advancing the letkf members and processes computing the "
+        "local transforms by latitude band (1: in the main process)",
+    )
     parser.add_argument(
         "--obs_std",
         type=float,
         default=0.001,
     )
+    parser.add_argument(
+        "--obs_bands",
+        type=int,
+        default=6,
+        help="latitude bands of the observation-space statistics",
+    )
     parser.add_argument(
         "--obs_type",
         type=str,
@@ -100,18 +222,125 @@ def arg_parser():
         type=int,
         default=5,
     )
+    parser.add_argument(
+        "--init_cache_dir",
+        type=str,
+        default="da_cycle_results/init_cache",
+        help="cache of spun-up initial backgrounds shared by experiments "
+        "('': no cache)",
+    )
+    parser.add_argument(
+        "--state_cache_gb",
+        type=float,
+        default=0.0,
+        help="memory cap of the cache of ERA5 states (0: no cache)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="seed of the observation errors and the initial letkf members",
+    )
+    parser.add_argument(
+        "--keep_checkpoints",
+        type=int,
+        default=2,
+        help="number of per-cycle restart checkpoints to keep (0: none)",
+    )
+    parser.add_argument(
+        "--precision",
+        type=str,
+        default="float32",
+        choices=["float32", "bfloat16"],
+        help="dtype of the observation misfit of sc4dvar",
+    )
+    parser.add_argument(
+        "--precision_check",
+        action="store_true",
+        help="rerun each sc4dvar cycle in float32 and report the difference",
+    )
+    parser.add_argument(
+        "--distributed",
+        action="store_true",
+        help="sc4dvar over torchrun processes on gloo: rank 0 runs the model, "
+        "the others share the channels",
+    )
+    parser.add_argument(
+        "--error_maps",
+        action="store_true",
+        help="accumulate per-gridpoint bias / RMSE maps of xb and xa "
+        "(about 3 GB on disk)",
+    )
+    parser.add_argument(
+        "--climatology",
+        type=str,
+        default="",
+        help="climatology built by build_climatology.py, for the activity and "
+        "ACC scores ('': none)",
+    )
     parser.add_argument("--save_field", action="store_true")
     parser.add_argument("--save_gt", action="store_true")
     parser.add_argument("--save_obs", action="store_true")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     return args
 
 
-class data_reader:
-    def __init__(self, obs_type, obs_std, model_std, da_win, cycle_time, step_int_time):
-        import xarray as xr
+class shared_resources:
+    """
+    Resources shared by the experiments run in one process: the cache of ERA5
+    states, the ONNX sessions, the spherical harmonic transforms and the ERA5
+    dataset handle.
+    """
+
+    def __init__(self, cache_bytes=0):
+        self.states = StateCache(cache_bytes)
+        self.sessions = {}
+        self.transforms = {}
+        self.ds = None
+
+    def session(self, path):
+        if path not in self.sessions:
+            self.sessions[path] = onnxruntime.InferenceSession(
+                path, providers=["CPUExecutionProvider"]
+            )
+        return self.sessions[path]
+
+    def sht(self, nlat, nlon, device):
+        """
+        Returns the (RealSHT, InverseRealSHT) pair of a grid.
+        """
+        key = (nlat, nlon, str(device))
+        if key not in self.transforms:
+            self.transforms[key] = (
+                RealSHT(nlat, nlon, grid="equiangular").to(device),
+                InverseRealSHT(nlat, nlon, grid="equiangular").to(device),
+            )
+        return self.transforms[key]
+
+    def dataset(self):
+        if self.ds is None:
+            import xarray as xr
 
+            self.ds = xr.open_zarr(GCLOUD_BUCKET)
+        return self.ds
+
+
+class data_reader:
+    def __init__(
+        self,
+        obs_type,
+        obs_std,
+        model_std,
+        da_win,
+        cycle_time,
+        step_int_time,
+        shared=None,
+        generator=None,
+    ):
+        self.shared = shared if shared is not None else shared_resources()
+        # draws the observation errors; the global RNG without it
+        self.generator = generator
         self.client = minio.Minio(
             AWS_S3_ENDPOINT_URL,
             AWS_ACCESS_KEY_ID,
@@ -130,8 +359,6 @@ class data_reader:
         self.obs_var = obs_var_norm * model_std.reshape(-1, 1, 1) ** 2
         self.timestamp: None | pd.Timestamp = None
 
-        self.ds = xr.open_zarr(GCLOUD_BUCKET)
-
     def get_one_state_from_gcloud(self, tstamp, save_timestamp=True):
         if save_timestamp:
             self.timestamp = tstamp
@@ -153,7 +380,8 @@ class data_reader:
         ]
 
         # Filter dataset
-        filtered_ds = self.ds.sel(
+        # opened on first use, so readers of the other backends never open it
+        filtered_ds = self.shared.dataset().sel(
             time=tstamp,
             level=selected_levels,  # Filter by pressure levels
         )
@@ -254,7 +482,10 @@ class data_reader:
         return torch.from_numpy(state).to(self.device)
 
     def get_state(self, tstamp):
-        return self.get_one_state_from_gcloud(tstamp)
+        self.timestamp = tstamp
+        return self.shared.states.get(
+            tstamp, lambda: self.get_one_state_from_gcloud(tstamp)
+        )
 
     def get_obs_mask(self, tstamp):
         H = torch.zeros(self.da_win, 69, 721, 1440).to(self.device)
@@ -274,20 +505,99 @@ class data_reader:
             state.append(self.get_state(current_time))
         gt = torch.stack(state, 0)
         obs = gt + torch.sqrt(self.obs_var) * torch.randn(
-            self.da_win, 69, 721, 1440
+            self.da_win, 69, 721, 1440, generator=self.generator
         ).to(self.device)
         return obs, gt
 
 
+class b_operator:
+    """
+    Square root of the background error covariance: an isotropic spectral
+    filter per channel with the channel variance factors folded in.
+
+    The transforms run in float32; the output buffer takes the dtype of the
+    background, so a bfloat16 background gives a bfloat16 field. One buffer is
+    allocated per dtype and reused, so the field returned by a call is
+    overwritten by the next call with the same dtype, unless ``out`` is given.
+    """
+
+    def __init__(self, sht, isht, coeffs_kernel, sph_scale, var_scale):
+        """
+        sht, isht:      forward / inverse transforms of the grid
+        coeffs_kernel:  C spectra of the correlation kernels (full resolution)
+        sph_scale:      L x M degree normalization (constant along M)
+        var_scale:      C channel variance factors
+        """
+        lmax = sht.lmax
+        self.sht = sht
+        self.isht = isht
+        self.nchannel = len(coeffs_kernel)
+        spectra = [coeffs[:lmax, 0] for coeffs in coeffs_kernel]
+        self.filter = (
+            (
+                torch.stack(spectra)
+                if spectra
+                else torch.zeros(0, lmax, dtype=torch.complex64)
+            ).reshape(self.nchannel, lmax, 1)
+            * sph_scale[:lmax, :1]
+            * var_scale.reshape(-1, 1, 1)
+        )  # C x L x 1
+        self.out = {}
+        self.calls = 0
+
+    def __call__(self, u, xb, out=None):
+        self.calls += 1
+        if out is None:
+            if xb.dtype not in self.out:
+                self.out[xb.dtype] = torch.zeros(
+                    self.nchannel,
+                    self.isht.nlat,
+                    self.isht.nlon,
+                    dtype=xb.dtype,
+                    device=xb.device,
+                )
+            # a fresh alias of the buffer, so the graph of the previous call is
+            # dropped
+            out = self.out[xb.dtype].detach()
+        for i in range(self.nchannel):
+            out[i] = self.isht(self.filter[i] * self.sht(u[i]))
+        return out.add_(xb)
+
+
 class cyclic_4dvar:
-    def __init__(self, args):
+    def __init__(self, args, shared=None):
+        """
+        shared: shared_resources of the process when several experiments run
+        in it; a private one is created if None
+        """
         self.device = "cpu"
+        self.shared = (
+            shared
+            if shared is not None
+            else shared_resources(int(args.state_cache_gb * 2**30))
+        )
         self.start_time = pd.Timestamp(args.start_time)
         self.end_time = pd.Timestamp(args.end_time)
         self.cycle_time = pd.Timedelta("12H")
         self.step_int_time = pd.Timedelta("6H")
         self.da_mode = args.da_mode
         self.da_win = args.da_win
+        if self.da_mode == "wc4dvar" and self.da_win < 2:
+            raise ValueError("wc4dvar needs a window of at least 2 time levels")
+        self.wc_workers = args.wc_workers or self.da_win - 1
+        self.outer_loops = args.outer_loops
+        self.ens_size = args.ens_size
+        self.loc_radius = args.loc_radius
+        self.inflation = args.inflation
+        self.letkf_workers = args.letkf_workers
+        self.letkf_pool = None
+        if self.da_mode == "letkf" and self.letkf_workers > 1:
+            self.letkf_pool = ProcessPoolExecutor(
+                self.letkf_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=torch.set_num_threads,
+                initargs=(max(1, os.cpu_count() // self.letkf_workers),),
+            )
         self.nlon = 1440
         self.nlat = 721
         self.hpad = 5
@@ -313,17 +623,68 @@ class cyclic_4dvar:
                 self.fullname.append(vname + str(geoheight))
         self.nlev = len(self.geoheight_list)
         self.nchannel = len(self.fullname)
+        self.distributed = args.distributed
+        if self.distributed:
+            if self.da_mode != "sc4dvar" or args.max_time or args.precision_check:
+                raise ValueError(
+                    "--distributed supports sc4dvar without --max_time and "
+                    "--precision_check"
+                )
+            self.rank, self.world_size = dist_utils.init_gloo()
+            if self.world_size < 2:
+                raise ValueError("--distributed needs at least 2 processes")
+            self.channel_groups = dist_utils.channel_groups(
+                self.nchannel, self.world_size
+            )
+        else:
+            self.rank, self.world_size = 0, 1
+            self.channel_groups = [slice(None)]
+        # channels of the B operator and the misfit owned by this process
+        self.channels = self.channel_groups[self.rank]
         self.Nit = args.Nit
+        self.minimizer = args.minimizer
+        self.minimizer_options = {
+            "lbfgs": {"history_size": args.history_size, "max_iter": args.max_iter},
+            "cg": {"n_pairs": args.precond_pairs},
+            "lanczos": {"n_pairs": args.precond_pairs},
+        }[args.minimizer]
+        self.stop_options = {
+            "gtol": args.gtol,
+            "ftol": args.ftol,
+            "max_eval": args.max_eval,
+        }
+        self.max_time = args.max_time
+        if args.precision != "float32" and self.da_mode != "sc4dvar":
+            # the other modes never use the misfit dtype
+            raise ValueError("--precision %s needs sc4dvar" % args.precision)
+        self.misfit_dtype = self.init_precision(args.precision)
+        self.precision_check = args.precision_check
+        self.mr_levels = self.parse_mr_levels(args.mr_levels)
+        # state carried from one cycle to the next
+        self.curvature = (
+            CurvaturePairs(args.precond_pairs) if args.precond_pairs else None
+        )
+        self.warm_start = args.warm_start
+        self.w_prev = None
+        self.ensemble = None
+        self.carry_over = True
 
         self.model_mean, self.model_std = self.get_model_mean_std()
         self.b_matrix = self.init_b_matrix(args.coeff_dir)
         self.q_matrix = self.init_q_matrix(args.coeff_dir)
-        self.flow_model = self.init_model(args.flow_model_dir)
-        self.forecast_model = self.init_model(args.forecast_model_dir)
+        # the model only runs on the inference rank
+        self.flow_model = (
+            self.init_model(args.flow_model_dir) if self.rank == 0 else None
+        )
+        self.forecast_model = (
+            self.init_model(args.forecast_model_dir) if self.rank == 0 else None
+        )
 
         self.init_lag = args.init_lag
+        self.init_cache_dir = args.init_cache_dir
         self.obs_std = args.obs_std
         self.obs_type = args.obs_type
+        self.obs_bands = args.obs_bands
         # if self.obs_type[:4] == "real":
 
         self.name = "%s_%s_std%.3f_win%d_lag%d_%s" % (
@@ -340,10 +701,38 @@ class cyclic_4dvar:
         self.save_interval = args.save_interval
         self.save_gt = args.save_gt
         self.save_obs = args.save_obs
-        self.metric = Metrics()
 
         self.init_file_dir()
+        self.telemetry = MinimizationTelemetry(
+            f"da_cycle_results/{self.name}/telemetry.jsonl"
+            if self.rank == 0
+            else f"da_cycle_results/{self.name}/telemetry_rank{self.rank}.jsonl"
+        )
+        self.checkpoint = CheckpointWriter(
+            f"da_cycle_results/{self.name}/checkpoints",
+            keep=args.keep_checkpoints if self.rank == 0 else 0,
+        )
+        self.resumed = None
+        self.epoch = 0
+        self.obs_log = ColumnarLog(
+            f"da_cycle_results/{self.name}/obs_stats",
+            {
+                "cycle": "<i8",
+                "channel": "<i2",
+                "band": "<i2",
+                "count": "<i8",
+                **{
+                    f"{kind}_{stat}": "<f4"
+                    for kind in ("omb", "oma")
+                    for stat in ("mean", "rms", "chi2")
+                },
+            },
+        )
 
+        # random stream of the experiment, kept apart from the global RNG that
+        # the experiments of multi_da share, so a resumed run draws the same
+        # observation errors and initial members as an uninterrupted one
+        self.generator = torch.Generator().manual_seed(args.seed)
         self.data_reader = data_reader(
             args.obs_type,
             args.obs_std,
@@ -351,35 +740,118 @@ class cyclic_4dvar:
             self.da_win,
             self.cycle_time,
             self.step_int_time,
+            shared=self.shared,
+            generator=self.generator,
         )
-        self.metrics_list = {
-            "bg_wrmse": [],
-            "ana_wrmse": [],
-            "bg_mse": [],
-            "ana_mse": [],
-            "bg_bias": [],
-            "ana_bias": [],
-        }
+        # background and analysis scores of every cycle, per region and channel,
+        # computed in the background
+        self.scores = None
+        self.verifier = None
+        self.error_maps = None
+        self.climatology = None
+        if self.rank == 0:
+            metrics = ("wrmse", "bias", "mse", "mae")
+            if args.climatology:
+                self.climatology = Climatology(args.climatology)
+                metrics += ("activity", "acc")
+            # the columns of the log are fixed when it is created
+            score_dir = f"da_cycle_results/{self.name}/scores"
+            recorded = ScoreStore.recorded_metrics(score_dir)
+            if recorded is not None and recorded != metrics:
+                flag = "with" if "acc" in recorded else "without"
+                raise ValueError(
+                    "the scores of %s were recorded %s --climatology, resume %s it"
+                    % (self.name, flag, flag)
+                )
+            self.scores = ScoreStore(score_dir, self.nchannel, metrics=metrics)
+            if args.error_maps:
+                self.error_maps = ErrorMaps(
+                    f"da_cycle_results/{self.name}/error_maps",
+                    (self.nchannel, self.nlat, self.nlon),
+                )
+            self.verifier = VerificationWorker(
+                self.scores,
+                self.model_mean.reshape(-1, 1, 1),
+                self.model_std.reshape(-1, 1, 1),
+                maps=self.error_maps,
+                climatology=self.climatology,
+            )
         self.current_time, self.xb = self.get_current_states()
-        self.load_eval_ckpts()
+        if self.distributed:
+            # the other ranks start or resume at the cycle of the inference rank
+            t = torch.tensor([self.current_time.value, self.epoch])
+            dist.broadcast(t, 0)
+            self.current_time, self.epoch = pd.Timestamp(t[0].item()), t[1].item()
+            # the minimizer state carried across cycles is replicated: a rank
+            # resuming without it would minimize in another variable
+            carried = [
+                self.w_prev,
+                None
+                if self.curvature is None
+                else (self.curvature.pairs, self.curvature.pos),
+            ]
+            dist.broadcast_object_list(carried, 0)
+            if self.rank > 0:
+                self.w_prev = carried[0]
+                if self.curvature is not None and carried[1] is not None:
+                    self.curvature.pairs, self.curvature.pos = carried[1]
+        if self.scores is not None:
+            # scores and observation statistics of the cycles to be run again
+            self.scores.rewind(self.current_time.value)
+            cycles = ColumnarLog.read(self.obs_log.directory)["cycle"]
+            self.obs_log.truncate(int((cycles < self.current_time.value).sum()))
+        # telemetry of the cycles to be run again, on every rank
+        self.telemetry.rewind(self.current_time)
 
         self.static_info = self.get_static_info()  ## for saving redundant calculations
 
+    def parse_mr_levels(self, mr_levels):
+        levels = []
+        for item in filter(None, mr_levels.split(",")):
+            factor, nit = (int(v) for v in item.split(":"))
+            if factor < 2 or (self.nlat - 1) % factor or self.nlon % factor:
+                raise ValueError(
+                    "invalid coarsening factor %d for a %dx%d grid"
+                    % (factor, self.nlat, self.nlon)
+                )
+            levels.append((factor, nit))
+        return levels
+
+    def init_precision(self, precision):
+        if precision == "float32":
+            return torch.float32
+        # bfloat16 only pays off with native support (AVX512-BF16 / AMX)
+        flags = ""
+        if os.path.exists("/proc/cpuinfo"):
+            with open("/proc/cpuinfo") as f:
+                flags = f.read()
+        if "avx512_bf16" in flags or "amx_bf16" in flags:
+            return torch.bfloat16
+        print("no native bfloat16 support on this CPU, falling back to float32")
+        return torch.float32
+
     def init_b_matrix(self, coeff_dir):
         len_scale = (
             torch.from_numpy(np.load(os.path.join(coeff_dir, "len_scale.npy")))
             .float()
             .to(self.device)
         )
-        return {"len_scale": len_scale}
+        # variance factors of z50, z100, z150 and z200 (channels 4-7) relative to
+        # the other channels
+        var_scale = torch.ones(self.nchannel).to(self.device)
+        var_scale[4] = 0.6
+        var_scale[5] = 0.6
+        var_scale[6] = 0.7
+        var_scale[7] = 0.8
+        return {"len_scale": len_scale, "var_scale": var_scale}
 
     def init_q_matrix(self, coeff_dir):
         q = []
         for i in range(1, self.da_win):
             q0 = (
-                torch.from_numpy(np.load(os.path.join(coeff_dir, "q%d.npy" % i))).to(
-                    self.device
-                )
+                torch.from_numpy(np.load(os.path.join(coeff_dir, "q%d.npy" % i)))
+                .float()
+                .to(self.device)
                 / self.model_std.reshape(-1, 1, 1) ** 2
             )
             q.append(
@@ -393,11 +865,9 @@ class cyclic_4dvar:
         return q
 
     def init_model(self, path):
-        # Load ONNX model
+        # Load ONNX model, one session per file in the process
         onnx_model_path = ONNX_MODEL_PATH
-        model = onnxruntime.InferenceSession(
-            onnx_model_path, providers=["CPUExecutionProvider"]
-        )
+        model = self.shared.session(onnx_model_path)
 
         return model
 
@@ -410,8 +880,7 @@ class cyclic_4dvar:
         y = np.linspace(-self.hpad, self.hpad, 2 * self.hpad + 1)
         xx, yy = np.meshgrid(x, y)
 
-        sht = RealSHT(self.nlat, self.nlon, grid="equiangular").to(self.device)
-        isht = InverseRealSHT(self.nlat, self.nlon, grid="equiangular").to(self.device)
+        sht, isht = self.shared.sht(self.nlat, self.nlon, self.device)
 
         kernel = torch.zeros(self.nchannel, self.nlat, self.nlon).to(self.device)
         coeffs_kernel = []
@@ -444,12 +913,40 @@ class cyclic_4dvar:
 
         print("R", R[:, :, 100, 100])
 
+        ### transforms on the subsampled grids of the multi-resolution schedule
+        levels = {}
+        for factor, _nit in self.mr_levels:
+            nlat = (self.nlat - 1) // factor + 1
+            nlon = self.nlon // factor
+            level_sht, level_isht = self.shared.sht(nlat, nlon, self.device)
+            levels[factor] = {
+                "factor": factor,
+                "sht": level_sht,
+                "isht": level_isht,
+                "B": b_operator(
+                    level_sht,
+                    level_isht,
+                    coeffs_kernel[self.channels],
+                    sph_scale,
+                    self.b_matrix["var_scale"][self.channels],
+                ),
+            }
+
         return {
             "R": R,
             "sht": sht,
             "isht": isht,
             "coeffs_kernel": coeffs_kernel,
             "sph_scale": sph_scale,
+            "B": b_operator(
+                sht,
+                isht,
+                coeffs_kernel[self.channels],
+                sph_scale,
+                self.b_matrix["var_scale"][self.channels],
+            ),
+            "factor": 1,
+            "levels": levels,
         }
 
     def get_model_mean_std(self):
@@ -460,7 +957,28 @@ class cyclic_4dvar:
         std_layer_gpu = torch.from_numpy(std_layer).float().to(self.device)
         return mean_layer_gpu, std_layer_gpu
 
+    def init_cache_path(self):
+        """
+        Path of the cached initial background, addressed by the hash of
+        (start_time, init_lag, forecast model file); None without a cache.
+        """
+        if not self.init_cache_dir:
+            return None
+        model_hash = hashlib.sha256()
+        with open(ONNX_MODEL_PATH, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 24), b""):
+                model_hash.update(chunk)
+        key = hashlib.sha256(
+            f"{self.start_time}|{self.init_lag}|{model_hash.hexdigest()}".encode()
+        ).hexdigest()
+        return os.path.join(self.init_cache_dir, f"xb_{key}.npy")
+
     def get_initial_state(self):
+        cache_path = self.init_cache_path()
+        if cache_path is not None and os.path.exists(cache_path):
+            print("loading the initial background from", cache_path)
+            return torch.from_numpy(np.load(cache_path)).float().to(self.device)
+
         x0 = self.data_reader.get_state(
             self.start_time - self.init_lag * pd.Timedelta("6H")
         )
@@ -470,12 +988,25 @@ class cyclic_4dvar:
         print("xb rmse per layer", rmse.cpu().numpy())
         mse = torch.mean(((gt - xb) / self.model_std.reshape(-1, 1, 1)) ** 2)
         print(f"xb mse: {mse:.3g}")
+
+        if cache_path is not None:
+            # written under a temporary name, so concurrent experiments only
+            # ever see complete files
+            os.makedirs(self.init_cache_dir, exist_ok=True)
+            tmp = f"{cache_path[: -len('.npy')]}.{os.getpid()}.tmp.npy"
+            np.save(tmp, xb.cpu().numpy())
+            os.replace(tmp, cache_path)
         return xb
 
-    def integrate(self, xa, model, step):
-        xa_next = self.data_reader.get_state(
-            self.data_reader.timestamp + pd.Timedelta(hours=6)
-        )
+    def integrate(self, xa, model, step, xa_next=None):
+        """
+        xa_next: optional second input frame; the state 6 h after the reader's
+        last timestamp is fetched if None
+        """
+        if xa_next is None:
+            xa_next = self.data_reader.get_state(
+                self.data_reader.timestamp + pd.Timedelta(hours=6)
+            )
         xa = torch.cat((xa, xa_next), 0)
 
         za = torch.stack(
@@ -490,7 +1021,8 @@ class cyclic_4dvar:
                 ),
             ]
         )
-        z = za.unsqueeze(0).cpu().numpy()  # Convert to NumPy array for ONNX runtime
+        # the ONNX model is not differentiated
+        z = za.detach().unsqueeze(0).cpu().numpy()  # NumPy array for ONNX runtime
 
         # input_name = model.get_inputs()[0].name  # Get input layer name
         # output_name = model.get_outputs()[0].name  # Get output layer name
@@ -510,23 +1042,88 @@ class cyclic_4dvar:
         ) + self.model_mean.reshape(-1, 1, 1)
 
     def get_current_states(self):
-        if os.path.exists(f"da_cycle_results/{self.name}/current_time.txt"):
+        if self.rank > 0:
+            # received from the inference rank: the time in __init__, the
+            # background every cycle
+            return self.start_time, torch.zeros(self.nchannel, self.nlat, self.nlon)
+        self.resumed = self.checkpoint.load_latest()
+        if self.resumed is not None:
+            self.restore_checkpoint(self.resumed)
+        elif os.path.exists(f"da_cycle_results/{self.name}/current_time.txt"):
             f = open(f"da_cycle_results/{self.name}/current_time.txt")
             self.current_time = pd.Timestamp(f.read())
             state = np.load(f"da_cycle_results/{self.name}/xb.npy")
-            self.xb = torch.from_numpy(state).to(self.device)
+            self.xb = torch.from_numpy(state).float().to(self.device)
         else:
             self.current_time = self.start_time
             self.xb = self.get_initial_state()
 
         return self.current_time, self.xb
 
-    def save_eval_result(self, finish=False, gt=None, obs=None):
-        for key in self.metrics_list:
-            np.save(f"da_cycle_results/{self.name}/{key}", self.metrics_list[key])
-        print("finish saving results")
+    def checkpoint_state(self):
+        """
+        Everything needed to resume at self.current_time. Containers are copied,
+        as the checkpoint is written in the background while the next cycle
+        runs; the tensors are replaced, not modified, from cycle to cycle.
+        """
+        return {
+            "current_time": str(self.current_time),
+            "epoch": self.epoch,
+            "xb": self.xb,
+            "xa": self.xa,
+            "rng": self.generator.get_state(),
+            # state carried across cycles by the minimizers and the ensemble
+            "w_prev": self.w_prev,
+            "curvature": None
+            if self.curvature is None
+            else {"pairs": list(self.curvature.pairs), "pos": self.curvature.pos},
+            "ensemble": self.ensemble,
+        }
+
+    def restore_checkpoint(self, state):
+        print("resuming from the checkpoint of", state["current_time"])
+        self.current_time = pd.Timestamp(state["current_time"])
+        self.epoch = state["epoch"]
+        self.xb = state["xb"].float().to(self.device)
+        self.xa = state["xa"]
+        self.generator.set_state(state["rng"])
+        self.w_prev = state["w_prev"]
+        if self.curvature is not None and state["curvature"] is not None:
+            self.curvature.pairs = state["curvature"]["pairs"][
+                : self.curvature.capacity
+            ]
+            self.curvature.pos = state["curvature"]["pos"] % self.curvature.capacity
+        self.ensemble = state["ensemble"]
 
-        if not finish:
+    def save_eval_result(self, finish=False, gt=None, obs=None):
+        if finish:
+            idx = 11
+            for kind in self.scores.kinds:
+                n, summary = self.scores.summary(kind)
+                mean, std = summary["wrmse"]
+                print(
+                    "%s over %d cycles: RMSE (z500) %.4g +- %.4g"
+                    % (kind, n, mean[0, idx], std[0, idx]),
+                    flush=True,
+                )
+                if "acc" in summary:
+                    mean, std = summary["acc"]
+                    print(
+                        "%s over %d cycles: ACC (z500) %.4g +- %.4g"
+                        % (kind, n, mean[0, idx], std[0, idx]),
+                        flush=True,
+                    )
+                if self.error_maps is not None:
+                    self.error_maps.export(kind)
+                # the per-cycle arrays of the earlier runs, read by visualize/
+                _, wrmse = self.scores.history(kind, "wrmse")
+                _, bias = self.scores.history(kind, "bias")
+                _, mse = self.scores.history(kind, "mse")
+                np.save(f"da_cycle_results/{self.name}/{kind}_wrmse", wrmse[:, 0])
+                np.save(f"da_cycle_results/{self.name}/{kind}_bias", bias[:, 0])
+                np.save(f"da_cycle_results/{self.name}/{kind}_mse", mse[:, 0].mean(-1))
+            print("finish saving results")
+        else:
             np.save(f"da_cycle_results/{self.name}/xb", self.xb.cpu().numpy())
             with open(f"da_cycle_results/{self.name}/current_time.txt", "w") as f:
                 f.write(str(self.current_time))
@@ -553,86 +1150,157 @@ class cyclic_4dvar:
                 )
                 print("finish saving observations")
 
-    def load_eval_ckpts(self):
-        for key in self.metrics_list:
-            if os.path.exists("da_cycle_results/%s/%s.npy" % (self.name, key)):
-                self.metrics_list[key] = np.load(
-                    "da_cycle_results/%s/%s.npy" % (self.name, key)
-                ).tolist()
-
     def get_obs_info(self):
-        yo, gt = self.data_reader.get_obs_gt(self.current_time)
-        H = self.data_reader.get_obs_mask(self.current_time)
+        if self.rank == 0:
+            yo, gt = self.data_reader.get_obs_gt(self.current_time)
+            H = self.data_reader.get_obs_mask(self.current_time)
+        else:
+            yo = torch.empty(self.da_win, self.nchannel, self.nlat, self.nlon)
+            H = torch.empty_like(yo)
+            gt = None
+        if self.distributed:
+            yo, H = yo.float().contiguous(), H.float().contiguous()
+            dist.broadcast(yo, 0)
+            dist.broadcast(H, 0)
         R = self.static_info["R"]
 
         return yo, H, R, gt
 
-    def transform(self, u, xb):
-        field_horizon = []
+    def gather_channels(self, x):
+        """
+        Full C x H x W field from the channels of every rank, on the inference
+        rank; None on the other ranks. The identity when not distributed.
+        """
+        if not self.distributed:
+            return x
+        return dist_utils.gather_channels(x, self.channel_groups)
+
+    def scatter_channels(self, x, grid):
+        """
+        Channels of this rank of a C x H x W field of the inference rank
+        (ignored on the other ranks). The identity when not distributed.
+        """
+        if not self.distributed:
+            return x
+        return dist_utils.scatter_channels(x, self.channel_groups, grid)
+
+    def restrict(self, x, factor):
+        """
+        Subsample the trailing lat/lon grid by ``factor`` (poles are kept).
+        """
+        return x[..., ::factor, ::factor]
+
+    def prolong(self, x, level):
+        """
+        Interpolate a field on the grid of ``level`` to the full grid by
+        zero-padding its spherical harmonic coefficients.
+        """
+        coeffs = level["sht"](x.float())
+        lmax, mmax = coeffs.shape[-2:]
+        coeffs_full = torch.zeros(
+            *coeffs.shape[:-2],
+            self.static_info["sht"].lmax,
+            self.static_info["sht"].mmax,
+            dtype=coeffs.dtype,
+            device=coeffs.device,
+        )
+        coeffs_full[..., :lmax, :mmax] = coeffs
+        return self.static_info["isht"](coeffs_full)
+
+    def transform(self, u, xb, level=None):
+        """
+        u:      C x h x w control variable on the grid of ``level``
+        xb:     C x h x w background on the same grid
+        level:  entry of static_info["levels"], None for the full grid
+        """
+        level = self.static_info if level is None else level
+        return level["B"](u, xb)
+
+    def evaluate(self, x_norm, gt_norm):
+        """
+        Returns WRMSE and bias per channel and the total MSE of a normalized
+        field ``x_norm`` (C x H x W) against ``gt_norm``, from one pass over the
+        fields.
+        """
+        scores = fused_scores(
+            x_norm, gt_norm, data_std=self.model_std.double(), regions=("all",)
+        )
+        return (
+            scores["wrmse"][0].float(),
+            scores["bias"][0].float(),
+            scores["mse"][0].mean().item(),
+        )
 
-        for i in range(self.nchannel):
-            coeffs_field = self.static_info["sht"](u[i])
-            field_horizon.append(
-                self.static_info["isht"](
-                    self.static_info["sph_scale"]
-                    * coeffs_field
-                    * self.static_info["coeffs_kernel"][i][:, 0].reshape((self.nlat, 1))
-                ).unsqueeze(0)
+    def letkf_analysis(self, ens, yo, H, R):
+        """
+        ens:    K x C x H x W normalized background members
+        yo:     C x H x W normalized observations, H: mask, R: variances
+
+        Local ensemble transform at every grid point, with the observations of
+        all channels around it weighted by the localization taper (R
+        localization); the local transforms are computed in latitude bands.
+        """
+        K, C, nlat, nlon = ens.shape
+        mean = ens.mean(0)
+        X = ens - mean
+        XR = X * (H / R)
+
+        # Yb^T R^-1 Yb and Yb^T R^-1 d summed over channels, then localized
+        P = localize(
+            torch.einsum("ichw,jchw->ijhw", X, XR).reshape(K * K, nlat, nlon),
+            self.loc_radius,
+        )
+        b = localize(torch.einsum("ichw,chw->ihw", XR, yo - mean), self.loc_radius)
+        A = P.reshape(K, K, -1).permute(2, 0, 1) + (K - 1) / self.inflation * torch.eye(
+            K
+        )
+        b = b.reshape(K, -1).T
+
+        nband = max(8, self.letkf_workers)
+        starts = [
+            int(r[0]) * nlon for r in torch.tensor_split(torch.arange(nlat), nband)
+        ]
+        A_bands = torch.tensor_split(A, starts[1:])
+        b_bands = torch.tensor_split(b, starts[1:])
+        if self.letkf_pool is None:
+            W = [
+                letkf_weights(a, bb, K) for a, bb in zip(A_bands, b_bands, strict=True)
+            ]
+        else:
+            W = list(
+                self.letkf_pool.map(
+                    letkf_weights, A_bands, b_bands, itertools.repeat(K)
+                )
             )
+        W = torch.cat(W).reshape(nlat, nlon, K, K)
 
-        coeff_expand = torch.zeros(69, 721, 1440).to(self.device) + 1
-        coeff_expand[4] = 0.6
-        coeff_expand[5] = 0.6
-        coeff_expand[6] = 0.7
-        coeff_expand[7] = 0.8
-        field_horizon = (
-            torch.cat(field_horizon, 0) * coeff_expand
-        )  # * torch.sqrt(q6_norm_layer)
+        return mean + torch.einsum("ichw,hwij->jchw", X, W)
 
-        return field_horizon + xb
+    def forecast_ensemble(self):
+        """
+        Advance the letkf analysis members one cycle, concurrently, and return
+        the forecast mean as the next background.
+        """
+        # the same second input frame for every member
+        xa_next = self.data_reader.get_state(
+            self.data_reader.timestamp + pd.Timedelta(hours=6)
+        )
+        with ThreadPoolExecutor(self.letkf_workers) as pool:
+            members = list(
+                pool.map(
+                    lambda x: self.integrate(x, self.forecast_model, 1, xa_next),
+                    self.ensemble,
+                )
+            )
+        self.ensemble = torch.stack(members, 0)
+        return self.ensemble.mean(0)
 
     def one_step_DA(self, gt, xb, yo, H, R, mode):
         if mode == "free_run":
-            gt_norm = (
-                gt[0] - self.model_mean.reshape(-1, 1, 1)
-            ) / self.model_std.reshape(-1, 1, 1)  # C x H x W
-            xb_norm = (xb - self.model_mean.reshape(-1, 1, 1)) / self.model_std.reshape(
-                -1, 1, 1
-            )  # C x H x W
-            WRMSE_bg = self.metric.WRMSE(
-                xb_norm.unsqueeze(0).clone().detach().cpu(),
-                gt_norm.unsqueeze(0).clone().detach().cpu(),
-                None,
-                None,
-                self.model_std.cpu(),
-            ).detach()
-            bias_bg = self.metric.Bias(
-                xb_norm.unsqueeze(0).clone().detach().cpu(),
-                gt_norm.unsqueeze(0).clone().detach().cpu(),
-                None,
-                None,
-                self.model_std.cpu(),
-            ).detach()
-            MSE_bg = torch.mean((xb_norm - gt_norm) ** 2).item()
-
-            self.metrics_list["bg_wrmse"].append(WRMSE_bg)
-            self.metrics_list["bg_bias"].append(bias_bg)
-            self.metrics_list["bg_mse"].append(MSE_bg)
-
             start_clock = time.time()
             xa = xb
-            layer = 11
-            print(
-                "MSE (total): %.4g RMSE (z500): %.4g Bias (z500): %.4g"
-                % (MSE_bg, WRMSE_bg[layer], bias_bg[layer]),
-                flush=True,
-            )
             end_clock = time.time()
 
-            self.metrics_list["ana_wrmse"].append(WRMSE_bg)
-            self.metrics_list["ana_bias"].append(bias_bg)
-            self.metrics_list["ana_mse"].append(MSE_bg)
-
             print(
                 "%s DA finished. Time consumed: %d (s)"
                 % (self.current_time, end_clock - start_clock),
@@ -649,157 +1317,816 @@ class cyclic_4dvar:
                 """
                 return torch.sum(x0**2) / 2
 
-            def cal_loss_obs(x):
+            def forecast_levels(x):
                 """
-                x0:       C x H x W
-                obs:      T x C x H x W
-                H:        T x C x H x W
-                obs_var:  T x C x H x W
+                x:  C x h x w, every channel on the grid of the level
+
+                Forecasts of the later time levels of the window, on the grid
+                of the level.
                 """
-                x_list = [
-                    x,
-                ]
-                for i in range(self.da_win - 1):
-                    x = self.integrate(
-                        x * self.model_std.reshape(-1, 1, 1)
-                        + self.model_mean.reshape(-1, 1, 1),
-                        self.flow_model,
-                        1,
-                    )[:69]
+                forecasts = []
+                for _i in range(self.da_win - 1):
+                    if level["factor"] > 1:
+                        # the forecast model only runs on the full grid
+                        x = xb_norm + self.prolong(x - level["xb_full"], level)
+                    with self.telemetry.timer("model"):
+                        x = self.integrate(
+                            x * self.model_std.reshape(-1, 1, 1)
+                            + self.model_mean.reshape(-1, 1, 1),
+                            self.flow_model,
+                            1,
+                        )[:69]
+                    self.telemetry.count("model_calls")
                     x = (
                         x - self.model_mean.reshape(-1, 1, 1)
                     ) / self.model_std.reshape(-1, 1, 1)
-                    x_list.append(x)
-
-                x_pred = torch.stack(x_list, 0)  # T x C x H x W
+                    forecasts.append(self.restrict(x, level["factor"]))
+                return forecasts
 
-                return torch.sum(H * (x_pred - yo_norm) ** 2 / R) / 2
-
-            def loss(w):
-                xhat = self.transform(w, xb_norm)
-                return cal_loss_bg(w) + cal_loss_obs(xhat)
+            def cal_loss_obs(x, x_full):
+                """
+                x:        C x H x W, the channels of this rank
+                x_full:   every channel, on the inference rank only (None
+                          elsewhere)
+                obs:      T x C x H x W
+                H:        T x C x H x W
+                obs_var:  T x C x H x W
+                """
+                if x_full is None:
+                    forecasts = [None] * (self.da_win - 1)
+                elif level["factor"] > 1:
+                    # the forecast model only runs on the full grid: a coarse
+                    # level forecasts the state it starts from once and keeps
+                    # that trajectory, so its evaluations cost no model run;
+                    # the model is not differentiated, so the gradient is the
+                    # same as with a forecast per evaluation
+                    if "forecasts" not in level:
+                        level["forecasts"] = forecast_levels(x_full)
+                    forecasts = level["forecasts"]
+                else:
+                    forecasts = forecast_levels(x_full)
+                x_list = [x]
+                for x_next in forecasts:
+                    x_list.append(self.scatter_channels(x_next, x.shape[-2:]))
+
+                with self.telemetry.timer("misfit"):
+                    x_pred = torch.stack(x_list, 0)  # T x C x H x W
+
+                    # the departures are taken in float32, as the states and
+                    # observations are O(1) and their difference is of the
+                    # order of the observation error; only then are the
+                    # elementwise terms evaluated in the misfit dtype and
+                    # accumulated in float32
+                    d = (x_pred - level["yo_norm"]).to(dtype)
+                    return (
+                        torch.sum(
+                            level["H"] * d**2 / level["R"],
+                            dtype=torch.float32,
+                        )
+                        / 2
+                    )
+
+            def control(v):
+                """
+                control variable w = P^1/2 v of the minimizer variable v
+                """
+                return v if P is None else P.sqrt(v)
 
             def closure():
-                lbfgs.zero_grad()
-                objective = loss(w)
-                objective.backward()
+                nonlocal n_eval
+                n_eval += 1
+                self.telemetry.start_evaluation()
+                v.grad = None
+                w = control(v)
+                with self.telemetry.timer("transform"):
+                    if dtype == torch.float32:
+                        xhat = self.transform(w[ch], level["xb_norm"], level)
+                    else:
+                        # the increment in the misfit dtype, added to the
+                        # float32 background
+                        xhat = level["xb_norm"] + self.transform(
+                            w[ch], zero_norm, level
+                        )
+                x_full = self.gather_channels(xhat)
+                # the control variable is replicated, its norm is counted once
+                objective_bg = cal_loss_bg(w) if lead else torch.zeros(())
+                objective_obs = cal_loss_obs(xhat, x_full)
+                objective = objective_bg + objective_obs
+                with self.telemetry.timer("backward"):
+                    if objective.requires_grad:
+                        objective.backward()
+                if self.distributed:
+                    if v.grad is None:
+                        v.grad = torch.zeros_like(v)
+                    costs = torch.stack([objective_bg, objective_obs]).detach()
+                    with self.telemetry.timer("allreduce"):
+                        dist.all_reduce(v.grad)
+                        dist.all_reduce(costs)
+                    objective_bg, objective_obs = costs
+                    objective = costs.sum()
+                self.telemetry.log_evaluation(
+                    level=level_idx,
+                    iter=kk,
+                    cost=objective.item(),
+                    cost_bg=objective_bg.item(),
+                    cost_obs=objective_obs.item(),
+                    grad_norm=torch.linalg.vector_norm(v.grad).item(),
+                )
+                # published for the diagnostics of the outer loop; xhat aliases
+                # the B-operator buffer and stays valid until the next transform
+                diagnostics.update(
+                    n_eval=n_eval,
+                    cost=objective.item(),
+                    cost_bg=objective_bg.item(),
+                    cost_obs=objective_obs.item(),
+                    xhat=None if x_full is None else x_full.detach(),
+                    transform_calls=level["B"].calls,
+                )
                 return objective
 
-            w = torch.autograd.Variable(
-                torch.zeros(self.nchannel, self.nlat, self.nlon).to(self.device),
-                requires_grad=True,
-            )
+            def hvp(dv):
+                """
+                Hessian of the cost times dv: dv + B^T H^T R^-1 H B dv at the
+                first time level (the flow model is not differentiated), without
+                model calls; P^1/2 (...) P^1/2 dv when preconditioned.
+                """
+                if P is not None:
+                    return P.sqrt(hvp_w(P.sqrt(dv)))
+                return hvp_w(dv)
+
+            def hvp_w(dw):
+                dw = dw.detach().requires_grad_(True)
+                with self.telemetry.timer("transform"):
+                    dx = self.transform(dw[ch], zero_norm, level)
+                with self.telemetry.timer("misfit"):
+                    q = (
+                        torch.sum(
+                            level["H"][0] * dx**2 / level["R"][0], dtype=torch.float32
+                        )
+                        / 2
+                    )
+                with self.telemetry.timer("backward"):
+                    (Hdw,) = (
+                        torch.autograd.grad(q, dw)
+                        if q.requires_grad
+                        else (torch.zeros_like(dw),)
+                    )
+                if self.distributed:
+                    with self.telemetry.timer("allreduce"):
+                        dist.all_reduce(Hdw)
+                self.telemetry.count("hvp")
+                return Hdw + dw.detach()
+
+            # when distributed, the control variable and the minimizer are
+            # replicated on every rank, which owns the B operator and the
+            # misfit of its channels ch; the inference rank (lead) runs the
+            # model, verifies and reports
+            ch = self.channels
+            lead = self.rank == 0
             gt_norm = (
-                gt[0] - self.model_mean.reshape(-1, 1, 1)
-            ) / self.model_std.reshape(-1, 1, 1)
+                (gt[0] - self.model_mean.reshape(-1, 1, 1))
+                / self.model_std.reshape(-1, 1, 1)
+                if lead
+                else None
+            )
             yo_norm = (
                 yo - self.model_mean.reshape(1, -1, 1, 1)
             ) / self.model_std.reshape(1, -1, 1, 1)  # T x C x H x W
+            xb_norm = (xb - self.model_mean.reshape(-1, 1, 1)) / self.model_std.reshape(
+                -1, 1, 1
+            )  # C x H x W
 
-            lbfgs = optim.LBFGS(
-                [w], history_size=10, max_iter=5, line_search_fn="strong_wolfe"
-            )
+            # B-operator increments, mask, R and the elementwise misfit terms in
+            # the misfit dtype; states, observations, departures, control
+            # variable and minimizer state in float32
+            dtype = self.misfit_dtype
             idx = 11
             start_clock = time.time()
+            self.telemetry.start_cycle(self.current_time)
+            deadline = start_clock + self.max_time if self.max_time else None
+
+            # coarse levels first, then Nit iterations on the full grid
+            schedule = self.mr_levels + [(1, self.Nit)]
+            # spectral preconditioner from the curvature pairs of earlier cycles
+            precond = self.curvature.preconditioner() if self.curvature else None
+            if precond is not None and lead:
+                print("preconditioner: %d Ritz pairs" % len(precond), flush=True)
+
+            diagnostics = {}
+            w, level = None, None
+            for level_idx, (factor, nit) in enumerate(schedule):
+                level_clock = time.time()
+                prev_level = level
+                xb_full = self.restrict(xb_norm, factor)
+                level = dict(
+                    self.static_info
+                    if factor == 1
+                    else self.static_info["levels"][factor],
+                    xb_full=xb_full,
+                    xb_norm=xb_full[ch],
+                    gt_norm=self.restrict(gt_norm, factor) if lead else None,
+                    yo_norm=self.restrict(yo_norm, factor)[:, ch],
+                    H=self.restrict(H, factor)[:, ch].to(dtype),
+                    R=self.restrict(R, factor)[:, ch].to(dtype),
+                )
+                # the preconditioner acts on the full-grid control variable only
+                P = precond if factor == 1 else None
+                if w is not None:
+                    # warm start from the previous level
+                    w0 = self.restrict(self.prolong(w, prev_level), factor)
+                elif self.warm_start and self.w_prev is not None:
+                    # warm start from the previous cycle
+                    w0 = self.warm_start * self.restrict(self.w_prev, factor)
+                else:
+                    w0 = torch.zeros(level["xb_full"].shape).to(self.device)
+                v0 = w0 if P is None else P.inv_sqrt(w0)
+                v = torch.autograd.Variable(v0.contiguous(), requires_grad=True)
+                zero_norm = torch.zeros_like(level["xb_norm"], dtype=dtype)
+
+                minimizer = build_minimizer(
+                    self.minimizer,
+                    v,
+                    **self.minimizer_options,
+                    **({} if self.minimizer == "lbfgs" else {"hvp": hvp}),
+                    **self.stop_options,
+                    deadline=deadline,
+                )
+                n_eval = 0
+
+                kk = 0
+                while kk < nit and minimizer.stop_reason is None:
+                    n_eval_prev = n_eval
+                    info = minimizer.step(closure)
+                    if self.distributed:
+                        # keep the replicas bitwise identical
+                        dist.broadcast(v.detach(), 0)
+                    self.telemetry.log_iteration(
+                        level=level_idx,
+                        iter=kk,
+                        minimizer=self.minimizer,
+                        cost=minimizer.f,
+                        grad_norm=minimizer.g_norm,
+                        **info,
+                    )
+                    kk = kk + 1
+
+                    # diagnostics come from the last closure evaluation only and
+                    # never trigger model or transform calls of their own
+                    line = "level: %d, iter: %d, loss: %.4g grad norm: %.4g" % (
+                        level_idx,
+                        kk,
+                        minimizer.f,
+                        minimizer.g_norm,
+                    )
+                    if not lead:
+                        continue
+                    if (
+                        n_eval > n_eval_prev
+                        and diagnostics["transform_calls"] == level["B"].calls
+                    ):
+                        WRMSE_GT, bias_GT, MSE_GT = self.evaluate(
+                            diagnostics["xhat"], level["gt_norm"]
+                        )
+                        line += (
+                            " | last evaluation: MSE (total): %.4g RMSE (z500): %.4g"
+                            " Bias (z500): %.4g loss obs: %.4g loss bg: %.4g"
+                            % (
+                                MSE_GT,
+                                WRMSE_GT[idx].item(),
+                                bias_GT[idx].item(),
+                                diagnostics["cost_obs"],
+                                diagnostics["cost_bg"],
+                            )
+                        )
+                    print(line, flush=True)
+
+                if lead:
+                    print(
+                        "level %d (1/%d grid, %dx%d): %d iterations, "
+                        "%d cost evaluations, %.1f (s), stop: %s"
+                        % (
+                            level_idx,
+                            factor,
+                            level["xb_full"].shape[-2],
+                            level["xb_full"].shape[-1],
+                            kk,
+                            n_eval,
+                            time.time() - level_clock,
+                            minimizer.stop_reason or "Nit",
+                        ),
+                        flush=True,
+                    )
+                w = control(v).detach()
+
+                if factor == 1 and self.curvature is not None and self.carry_over:
+                    # pairs of P^1/2 A P^1/2 map back to pairs of A
+                    pairs = minimizer.curvature_pairs()
+                    if P is not None:
+                        pairs = [(P.sqrt(s), P.inv_sqrt(y)) for s, y in pairs]
+                    for s, y in pairs:
+                        self.curvature.push(s, y)
+
+            if self.carry_over:
+                self.w_prev = w
+            xhat_norm = self.gather_channels(self.transform(w[ch], xb_norm[ch]))
+            end_clock = time.time()
+            if not lead:
+                self.telemetry.end_cycle(
+                    levels=len(schedule),
+                    precision=str(dtype),
+                    precond_pairs=len(precond) if precond is not None else 0,
+                    time_da=end_clock - start_clock,
+                )
+                return None
+            end_clock = time.time()
+            self.telemetry.end_cycle(
+                levels=len(schedule),
+                precision=str(dtype),
+                precond_pairs=len(precond) if precond is not None else 0,
+                time_da=end_clock - start_clock,
+            )
+            print(
+                "%s DA finished. Time consumed: %d (s)"
+                % (self.current_time, end_clock - start_clock),
+                flush=True,
+            )
 
-            kk = 0
-            while kk <= self.Nit:
-                xb_norm = (
-                    xb - self.model_mean.reshape(-1, 1, 1)
-                ) / self.model_std.reshape(-1, 1, 1)  # C x H x W
-
-                xhat_norm = self.transform(w, xb_norm)
-                # xhat_norm  = (xhat - self.model_mean.reshape(-1, 1, 1)) / self.model_std.reshape(-1, 1, 1)
-                WRMSE_GT = self.metric.WRMSE(
-                    xhat_norm.unsqueeze(0).clone().detach().cpu(),
-                    gt_norm.unsqueeze(0).clone().detach().cpu(),
-                    None,
-                    None,
-                    self.model_std.cpu(),
-                ).detach()
-                bias_GT = self.metric.Bias(
-                    xhat_norm.unsqueeze(0).clone().detach().cpu(),
-                    gt_norm.unsqueeze(0).clone().detach().cpu(),
-                    None,
-                    None,
-                    self.model_std.cpu(),
-                ).detach()
-                RMSE_z500_GT = WRMSE_GT[idx].item()
-                bias_z500_GT = bias_GT[idx].item()
-                MSE_GT = torch.mean((xhat_norm - gt_norm) ** 2).item()
-                loss_total = loss(w).item()
-                loss_bg = cal_loss_bg(w).item()
-                loss_obs = cal_loss_obs(xhat_norm).item()
+            return xhat_norm * self.model_std.reshape(
+                -1, 1, 1
+            ) + self.model_mean.reshape(-1, 1, 1)
 
-                print(
-                    "iter: %d, MSE (total): %.4g RMSE (z500): %.4g Bias (z500): %.4g loss: %.4g loss obs: %.4g loss bg: %.4g"
-                    % (
-                        kk,
-                        MSE_GT,
-                        RMSE_z500_GT,
-                        bias_z500_GT,
-                        loss_total,
-                        loss_obs,
-                        loss_bg,
-                    ),
-                    flush=True,
+        elif mode in ("3dvar", "fgat"):
+            # incremental modes with no model run in the cost: 3dvar uses the
+            # observations of the first level only; fgat (first guess at
+            # appropriate time) compares every level with the trajectory from
+            # the current analysis, shifted by the increment at the start of the
+            # window, and re-runs that trajectory once per outer loop
+            mean = self.model_mean.reshape(-1, 1, 1)
+            std = self.model_std.reshape(-1, 1, 1)
+            yo_norm = (yo - mean) / std  # T x C x H x W
+            xb_norm = (xb - mean) / std  # C x H x W
+            if mode == "3dvar":
+                yo_norm, H, R = yo_norm[:1], H[:1], R[:1]
+            T = yo_norm.shape[0]
+            outer_loops = self.outer_loops if mode == "fgat" else 1
+
+            def closure():
+                nonlocal n_eval
+                n_eval += 1
+                self.telemetry.start_evaluation()
+                w.grad = None
+                with self.telemetry.timer("transform"):
+                    xhat = self.transform(w, xb_norm)
+                objective_bg = torch.sum(w**2) / 2
+                with self.telemetry.timer("misfit"):
+                    objective_obs = torch.sum(H * (xhat - yo_shifted) ** 2 / R) / 2
+                objective = objective_bg + objective_obs
+                with self.telemetry.timer("backward"):
+                    objective.backward()
+                self.telemetry.log_evaluation(
+                    outer=outer,
+                    iter=kk,
+                    cost=objective.item(),
+                    cost_bg=objective_bg.item(),
+                    cost_obs=objective_obs.item(),
+                    grad_norm=torch.linalg.vector_norm(w.grad).item(),
                 )
+                return objective
 
-                if kk == 0:
-                    self.metrics_list["bg_wrmse"].append(WRMSE_GT)
-                    self.metrics_list["bg_mse"].append(MSE_GT)
-                    self.metrics_list["bg_bias"].append(bias_GT)
-                elif kk == self.Nit:
-                    self.metrics_list["ana_wrmse"].append(WRMSE_GT)
-                    self.metrics_list["ana_mse"].append(MSE_GT)
-                    self.metrics_list["ana_bias"].append(bias_GT)
+            def hvp(dw):
+                """
+                Hessian of the cost times dw: dw + B^T (sum_k H_k^T R_k^-1 H_k) B dw
+                """
+                dw = dw.detach().requires_grad_(True)
+                with self.telemetry.timer("transform"):
+                    dx = self.transform(dw, zero_norm)
+                with self.telemetry.timer("misfit"):
+                    q = torch.sum(H * dx**2 / R) / 2
+                with self.telemetry.timer("backward"):
+                    (Hdw,) = torch.autograd.grad(q, dw)
+                self.telemetry.count("hvp")
+                return Hdw + dw.detach()
 
-                if kk < self.Nit:
-                    lbfgs.step(closure)
+            start_clock = time.time()
+            self.telemetry.start_cycle(self.current_time)
+            deadline = start_clock + self.max_time if self.max_time else None
+
+            zero_norm = torch.zeros_like(xb_norm)
+            w = torch.autograd.Variable(torch.zeros_like(xb_norm), requires_grad=True)
+            for outer in range(outer_loops):
+                yo_shifted = yo_norm
+                if T > 1:
+                    # trajectory from the current analysis; its departure from
+                    # the start of the window is moved to the observations
+                    x0 = self.transform(w.detach(), xb_norm).clone()
+                    x, traj = x0, [x0]
+                    for _k in range(T - 1):
+                        with self.telemetry.timer("model"):
+                            x = self.integrate(x * std + mean, self.flow_model, 1)
+                        self.telemetry.count("model_calls")
+                        x = (x[:69] - mean) / std
+                        traj.append(x)
+                    yo_shifted = yo_norm - (torch.stack(traj, 0) - x0)
+
+                minimizer = build_minimizer(
+                    self.minimizer,
+                    w,
+                    **self.minimizer_options,
+                    **({} if self.minimizer == "lbfgs" else {"hvp": hvp}),
+                    **self.stop_options,
+                    deadline=deadline,
+                )
+                n_eval = 0
+
+                kk = 0
+                while kk < self.Nit and minimizer.stop_reason is None:
+                    info = minimizer.step(closure)
+                    self.telemetry.log_iteration(
+                        outer=outer,
+                        iter=kk,
+                        minimizer=self.minimizer,
+                        cost=minimizer.f,
+                        grad_norm=minimizer.g_norm,
+                        **info,
+                    )
+                    kk = kk + 1
+                    print(
+                        "outer: %d, iter: %d, loss: %.4g grad norm: %.4g"
+                        % (outer, kk, minimizer.f, minimizer.g_norm),
+                        flush=True,
+                    )
+
+            xhat_norm = self.transform(w.detach(), xb_norm)
+            end_clock = time.time()
+            self.telemetry.end_cycle(
+                outer_loops=outer_loops,
+                time_da=end_clock - start_clock,
+            )
+            print(
+                "%s DA finished. Time consumed: %d (s)"
+                % (self.current_time, end_clock - start_clock),
+                flush=True,
+            )
+
+            return xhat_norm * std + mean
+
+        elif mode == "letkf":
+            # ensemble mode without adjoint: the members are carried across
+            # cycles and advanced by forecast_ensemble; the observations of the
+            # first level are assimilated
+            mean = self.model_mean.reshape(-1, 1, 1)
+            std = self.model_std.reshape(-1, 1, 1)
+            yo_norm = (yo[0] - mean) / std  # C x H x W
+            xb_norm = (xb - mean) / std  # C x H x W
+            if self.ensemble is None:
+                # initial members: perturbations drawn from B around xb
+                ens_norm = torch.stack(
+                    [
+                        self.transform(
+                            torch.randn(xb_norm.shape, generator=self.generator).to(
+                                xb_norm
+                            ),
+                            xb_norm,
+                        ).clone()
+                        for _ in range(self.ens_size)
+                    ],
+                    0,
+                )
+                ens_norm = ens_norm - ens_norm.mean(0) + xb_norm
+            else:
+                ens_norm = (self.ensemble - mean) / std
+            K = ens_norm.shape[0]
+
+            start_clock = time.time()
+            self.telemetry.start_cycle(self.current_time)
+
+            spread_bg = torch.sqrt(torch.mean(ens_norm.var(0)))
+            print("background spread: %.4g" % spread_bg.item(), flush=True)
 
-                kk = kk + 1
+            with self.telemetry.timer("letkf"):
+                ens_a = self.letkf_analysis(ens_norm, yo_norm, H[0], R[0])
+            xhat_norm = ens_a.mean(0)
 
-            w.detach()
-            xhat_norm = self.transform(w, xb_norm)
+            spread_ana = torch.sqrt(torch.mean(ens_a.var(0)))
+            print("analysis spread: %.4g" % spread_ana.item(), flush=True)
+            if self.carry_over:
+                self.ensemble = ens_a * std + mean
             end_clock = time.time()
+            self.telemetry.end_cycle(
+                members=K,
+                spread_bg=spread_bg.item(),
+                spread_ana=spread_ana.item(),
+                time_da=end_clock - start_clock,
+            )
             print(
                 "%s DA finished. Time consumed: %d (s)"
                 % (self.current_time, end_clock - start_clock),
                 flush=True,
             )
 
-            return xhat_norm * self.model_std.reshape(
-                -1, 1, 1
-            ) + self.model_mean.reshape(-1, 1, 1)
+            return xhat_norm * std + mean
+
+        elif mode == "wc4dvar":
+            # one control variable per time level of the window, x_k = xb_k + B w_k,
+            # tied to the forecast from the previous level through the model
+            # error variances of q_matrix; the observation errors are those of
+            # the first level, as model errors are no longer folded into R
+            T = self.da_win
+            mean = self.model_mean.reshape(-1, 1, 1)
+            std = self.model_std.reshape(-1, 1, 1)
+            yo_norm = (yo - mean) / std  # T x C x H x W
+            xb_norm = (xb - mean) / std  # C x H x W
+            Q = self.q_matrix  # (T - 1) x C x H x W
+            R_obs = R[:1]
+            B = self.static_info["B"]
+            # second input frame of the model for the sub-window starting at
+            # level k: the reference state at level k + 1
+            partners = gt[1:]
+            # threads of the sub-window forecasts, shared by every evaluation of
+            # the cycle
+            pool = ThreadPoolExecutor(self.wc_workers)
+
+            def model_steps(x):
+                """
+                x:  T x C x H x W
+                One model step from each of the first T - 1 levels (no gradient);
+                the sub-windows are independent and run concurrently.
+                """
+                inputs = [x[k].detach() * std + mean for k in range(T - 1)]
+                with self.telemetry.timer("model"):
+                    outputs = list(
+                        pool.map(
+                            lambda k: self.integrate(
+                                inputs[k], self.flow_model, 1, partners[k]
+                            ),
+                            range(T - 1),
+                        )
+                    )
+                self.telemetry.count("model_calls", T - 1)
+                return torch.stack([(z[:69] - mean) / std for z in outputs], 0)
+
+            def transform_all(w, x_ref):
+                return torch.stack(
+                    [
+                        B(w[k], x_ref[k], out=torch.empty_like(x_ref[k]))
+                        for k in range(T)
+                    ],
+                    0,
+                )
 
-        else:
-            raise NotImplementedError("not implemented da mode")
+            def closure():
+                nonlocal n_eval
+                n_eval += 1
+                self.telemetry.start_evaluation()
+                w.grad = None
+                with self.telemetry.timer("transform"):
+                    x = transform_all(w, xb_traj)
+                eta = x[1:] - model_steps(x)
+                objective_bg = torch.sum(w[0] ** 2) / 2
+                with self.telemetry.timer("misfit"):
+                    objective_q = torch.sum(eta**2 / Q) / 2
+                    objective_obs = torch.sum(H * (x - yo_norm) ** 2 / R_obs) / 2
+                objective = objective_bg + objective_q + objective_obs
+                with self.telemetry.timer("backward"):
+                    objective.backward()
+                self.telemetry.log_evaluation(
+                    iter=kk,
+                    cost=objective.item(),
+                    cost_bg=objective_bg.item(),
+                    cost_q=objective_q.item(),
+                    cost_obs=objective_obs.item(),
+                    grad_norm=torch.linalg.vector_norm(w.grad).item(),
+                )
+                return objective
 
-    def run_assimilation(self):
-        epoch = 0
+            def hvp(dw):
+                """
+                Hessian of the cost times dw, with the forecasts from the
+                previous levels held fixed (the flow model is not differentiated).
+                """
+                dw = dw.detach().requires_grad_(True)
+                with self.telemetry.timer("transform"):
+                    dx = transform_all(dw, zero_norm)
+                with self.telemetry.timer("misfit"):
+                    q = (
+                        torch.sum(dw[0] ** 2)
+                        + torch.sum(dx[1:] ** 2 / Q)
+                        + torch.sum(H * dx**2 / R_obs)
+                    ) / 2
+                with self.telemetry.timer("backward"):
+                    (Hdw,) = torch.autograd.grad(q, dw)
+                self.telemetry.count("hvp")
+                return Hdw
 
-        while self.current_time + self.cycle_time <= self.end_time:
-            print("current time:", self.current_time)
+            start_clock = time.time()
+            self.telemetry.start_cycle(self.current_time)
+            deadline = start_clock + self.max_time if self.max_time else None
+
+            # background trajectory through the window
+            xb_traj = [xb_norm]
+            for k in range(T - 1):
+                with self.telemetry.timer("model"):
+                    z = self.integrate(
+                        xb_traj[-1] * std + mean, self.flow_model, 1, partners[k]
+                    )
+                self.telemetry.count("model_calls")
+                xb_traj.append((z[:69] - mean) / std)
+            xb_traj = torch.stack(xb_traj, 0)  # T x C x H x W
+            zero_norm = torch.zeros_like(xb_traj)
+
+            w = torch.autograd.Variable(torch.zeros_like(xb_traj), requires_grad=True)
+            minimizer = build_minimizer(
+                self.minimizer,
+                w,
+                **self.minimizer_options,
+                **({} if self.minimizer == "lbfgs" else {"hvp": hvp}),
+                **self.stop_options,
+                deadline=deadline,
+            )
+            n_eval = 0
 
-            print("obtaining observations...")
-            yo, H, R, gt = self.get_obs_info()
+            kk = 0
+            try:
+                while kk < self.Nit and minimizer.stop_reason is None:
+                    info = minimizer.step(closure)
+                    self.telemetry.log_iteration(
+                        iter=kk,
+                        minimizer=self.minimizer,
+                        cost=minimizer.f,
+                        grad_norm=minimizer.g_norm,
+                        **info,
+                    )
+                    kk = kk + 1
+                    print(
+                        "iter: %d, loss: %.4g grad norm: %.4g"
+                        % (kk, minimizer.f, minimizer.g_norm),
+                        flush=True,
+                    )
+            finally:
+                pool.shutdown()
+
+            x = transform_all(w.detach(), xb_traj)
+            xhat_norm = x[0]
+            end_clock = time.time()
+            self.telemetry.end_cycle(
+                sub_windows=T - 1,
+                stop=minimizer.stop_reason or "Nit",
+                time_da=end_clock - start_clock,
+            )
+            print(
+                "%s DA finished. Time consumed: %d (s)"
+                % (self.current_time, end_clock - start_clock),
+                flush=True,
+            )
 
-            print("assimilating...")
-            self.xa = self.one_step_DA(
-                gt, self.xb, yo, H, R, self.da_mode
-            )  # [69, 721, 1440]
+            return xhat_norm * std + mean
 
-            if epoch % self.save_interval == 0:
+        else:
+            raise NotImplementedError("not implemented da mode")
+
+    def check_precision(self, gt, xb, yo, H, R, xa):
+        """
+        Rerun the cycle in float32 and append how far the reduced-precision
+        analysis ``xa`` is from it to precision_report.txt.
+        """
+        dtype, self.misfit_dtype = self.misfit_dtype, torch.float32
+        # the rerun starts from the same carried-over state and leaves it as is;
+        # its telemetry is tagged apart from that of the cycle
+        self.carry_over = False
+        self.telemetry.tag = "precision_check"
+        try:
+            xa_ref = self.one_step_DA(gt, xb, yo, H, R, self.da_mode)
+        finally:
+            self.carry_over = True
+            self.misfit_dtype = dtype
+            self.telemetry.tag = None
+
+        gt_norm = (gt[0] - self.model_mean.reshape(-1, 1, 1)) / self.model_std.reshape(
+            -1, 1, 1
+        )
+        xa_norm = (xa - self.model_mean.reshape(-1, 1, 1)) / self.model_std.reshape(
+            -1, 1, 1
+        )
+        xa_ref_norm = (
+            xa_ref - self.model_mean.reshape(-1, 1, 1)
+        ) / self.model_std.reshape(-1, 1, 1)
+        diff = (xa_norm - xa_ref_norm).detach()
+        WRMSE, _, MSE = self.evaluate(xa_norm, gt_norm)
+        WRMSE_ref, _, MSE_ref = self.evaluate(xa_ref_norm, gt_norm)
+        idx = 11
+        line = (
+            "%s %s: max |diff| %.4g RMS diff %.4g MSE %.4g (float32 %.4g) "
+            "RMSE (z500) %.4g (float32 %.4g)"
+            % (
+                self.current_time,
+                dtype,
+                torch.max(torch.abs(diff)).item(),
+                torch.sqrt(torch.mean(diff**2)).item(),
+                MSE,
+                MSE_ref,
+                WRMSE[idx].item(),
+                WRMSE_ref[idx].item(),
+            )
+        )
+        print(line, flush=True)
+        with open(f"da_cycle_results/{self.name}/precision_report.txt", "a") as f:
+            f.write(line + "\n")
+
+    def obs_diagnostics(self, xb, xa, yo, H, R):
+        """
+        O-B and O-A statistics at the observed points of the first time level,
+        per channel and latitude band, appended to obs_stats/ (rows keyed by
+        the cycle time in ns, channel and band).
+        """
+        mean = self.model_mean.reshape(-1, 1, 1)
+        std = self.model_std.reshape(-1, 1, 1)
+        stats = obs_space_stats(
+            {"omb": (xb - mean) / std, "oma": (xa - mean) / std},
+            (yo[0] - mean) / std,
+            H[0],
+            R[0],
+            self.obs_bands,
+        )
+        C, nband = stats["count"].shape
+        self.obs_log.append(
+            cycle=np.full(C * nband, self.current_time.value),
+            channel=np.repeat(np.arange(C), nband),
+            band=np.tile(np.arange(nband), C),
+            **{key: value.numpy() for key, value in stats.items()},
+        )
+
+        count = stats["count"]
+        total = count.sum().item()
+        print(
+            "obs space: %d obs, O-B rms %.4g chi2/N %.4g, O-A rms %.4g chi2/N %.4g"
+            % (
+                total,
+                torch.sqrt(torch.sum(stats["omb_rms"] ** 2 * count) / total).item(),
+                (torch.sum(stats["omb_chi2"] * count) / total).item(),
+                torch.sqrt(torch.sum(stats["oma_rms"] ** 2 * count) / total).item(),
+                (torch.sum(stats["oma_chi2"] * count) / total).item(),
+            ),
+            flush=True,
+        )
+
+    def run_cycle(self):
+        """
+        Run one DA cycle; returns False, without running it, once the end time
+        is reached.
+        """
+        if self.current_time + self.cycle_time > self.end_time:
+            return False
+        print("current time:", self.current_time)
+
+        print("obtaining observations...")
+        yo, H, R, gt = self.get_obs_info()
+        if self.distributed:
+            dist.broadcast(self.xb, 0)
+
+        print("assimilating...")
+        self.xa = self.one_step_DA(
+            gt, self.xb, yo, H, R, self.da_mode
+        )  # [69, 721, 1440], None off the inference rank
+        if self.rank == 0:
+            if self.precision_check and self.misfit_dtype != torch.float32:
+                self.check_precision(gt, self.xb, yo, H, R, self.xa)
+            self.obs_diagnostics(self.xb, self.xa.detach(), yo, H, R)
+            # xb and xa are replaced, not modified, by the next cycle
+            self.verifier.submit(self.current_time, self.xb, self.xa, gt[0])
+
+            if self.epoch % self.save_interval == 0:
                 self.save_eval_result(finish=False, gt=gt, obs=yo)
 
             print("integrating...")
-            self.xb = self.integrate(self.xa, self.forecast_model, 1)
-
-            self.current_time = self.current_time + self.cycle_time
-            epoch += 1
+            if self.da_mode == "letkf":
+                self.xb = self.forecast_ensemble()
+            else:
+                self.xb = self.integrate(self.xa, self.forecast_model, 1)
+
+        self.current_time = self.current_time + self.cycle_time
+        self.epoch += 1
+        if self.rank == 0:
+            # the checkpoint resumes after this cycle: its scores and error
+            # maps must be recorded first, or a preemption loses them
+            self.verifier.flush()
+            self.checkpoint.save(
+                self.current_time.strftime("%Y%m%d%H"), self.checkpoint_state()
+            )
+        return True
 
+    def finish(self):
         print("DA complete")
-        self.save_eval_result(finish=True, gt=None)
+        if self.rank == 0:
+            self.verifier.close()
+            self.save_eval_result(finish=True, gt=None)
+        self.checkpoint.close()
+        if self.distributed:
+            dist.destroy_process_group()
+
+    def run_assimilation(self):
+        while self.run_cycle():
+            pass
+        self.finish()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,68 @@
+import argparse
+import json
+
+from cyclic_da import arg_parser, cyclic_4dvar, shared_resources
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "configs",
+        type=str,
+        help="JSON list of experiments, each a dict of cyclic_da.py arguments, "
+        'e.g. [{"prefix": "a", "da_mode": "sc4dvar", "obs_std": 0.001, "seed": 1}, '
+        "...]",
+    )
+    parser.add_argument(
+        "--cache_gb",
+        type=float,
+        default=8.0,
+        help="memory cap of the ERA5 states cached for all experiments",
+    )
+    parser.add_argument(
+        "--max_active",
+        type=int,
+        default=4,
+        help="experiments held in memory at once; the others start as these finish",
+    )
+    return parser.parse_args()
+
+
+def config_to_argv(config):
+    argv = []
+    for key, value in config.items():
+        if value is True:
+            argv.append(f"--{key}")
+        elif value is not False:
+            argv.append(f"--{key}={value}")
+    return argv
+
+
+def run_experiments(configs, cache_gb=8.0, max_active=4):
+    """
+    Run the experiments in one process, one cycle of each in turn, sharing
+    the ERA5 state cache, the ONNX session and the spherical harmonic
+    transforms. Experiments over the same period then read each state once.
+    """
+    shared = shared_resources(int(cache_gb * 2**30))
+    pending = [arg_parser(config_to_argv(config)) for config in configs]
+    active = []
+    while pending or active:
+        while pending and len(active) < max_active:
+            active.append(cyclic_4dvar(pending.pop(0), shared=shared))
+        for agent in list(active):
+            if not agent.run_cycle():
+                agent.finish()
+                active.remove(agent)
+        print(
+            "state cache: %d hits, %d misses, %.1f GB"
+            % (shared.states.hits, shared.states.misses, shared.states.nbytes / 2**30),
+            flush=True,
+        )
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with open(args.configs) as f:
+        configs = json.load(f)
+    run_experiments(configs, args.cache_gb, args.max_active)
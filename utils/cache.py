@@ -0,0 +1,49 @@
+import threading
+from collections import OrderedDict
+
+
+class StateCache:
+    """
+    Least-recently-used cache of tensors bounded by their total size in bytes.
+    Cached tensors are shared by every caller and must not be modified in
+    place.
+    """
+
+    def __init__(self, max_bytes=0):
+        """
+        Initialization.
+
+        Parameters
+        ----------
+
+        max_bytes: int, optional, memory cap of the cache, 0 disables it.
+        """
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, load):
+        """
+        Returns the tensor cached under ``key``, calling ``load()`` on a miss.
+        """
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return self.items[key]
+        value = load()
+        self.misses += 1
+        size = value.element_size() * value.nelement()
+        if size > self.max_bytes:
+            return value
+        with self.lock:
+            if key not in self.items:
+                self.items[key] = value
+                self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, old = self.items.popitem(last=False)
+                self.nbytes -= old.element_size() * old.nelement()
+        return value
@@ -0,0 +1,106 @@
+import glob
+import os
+import queue
+import threading
+
+import torch
+
+
+class CheckpointWriter:
+    """
+    Per-cycle checkpoints written atomically by a background thread.
+
+    ``save`` queues a state dict and returns; the writer thread saves it to a
+    temporary file, syncs it to disk and renames it over ``cycle_<tag>.pt``, so
+    a checkpoint is either complete or absent. Only the ``keep`` latest
+    checkpoints are kept. The queue holds at most two states, which blocks the
+    caller if the disk falls behind rather than piling up cycles in memory.
+
+    The state must not be modified in place after ``save``: pass copies of
+    mutable containers.
+    """
+
+    def __init__(self, directory, keep=2):
+        """
+        Initialization.
+
+        Parameters
+        ----------
+
+        directory: str, required, where the checkpoints are written;
+
+        keep: int, optional, number of checkpoints to keep, 0 disables saving.
+        """
+        self.directory = directory
+        self.keep = keep
+        self.error = None
+        self.queue = queue.Queue(maxsize=2)
+        os.makedirs(directory, exist_ok=True)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def paths(self):
+        return sorted(glob.glob(os.path.join(self.directory, "cycle_*.pt")))
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is not None:
+                    self.write(*item)
+            except Exception as e:  # reported to the caller by save / close
+                self.error = e
+            finally:
+                self.queue.task_done()
+            if item is None:
+                return
+
+    def write(self, tag, state):
+        path = os.path.join(self.directory, f"cycle_{tag}.pt")
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            torch.save(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        dir_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        for old in self.paths()[: -self.keep]:
+            os.remove(old)
+
+    def check(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError("checkpoint writer failed") from error
+
+    def save(self, tag, state):
+        """
+        tag:    sortable name of the checkpoint, e.g. the cycle time
+        state:  dict of tensors / picklable objects
+        """
+        self.check()
+        if self.keep:
+            self.queue.put((tag, state))
+
+    def close(self):
+        """
+        Wait for the queued checkpoints to be written and stop the writer.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        self.check()
+
+    def load_latest(self):
+        """
+        Returns the state of the latest readable checkpoint, None if there is
+        none.
+        """
+        for path in reversed(self.paths()):
+            try:
+                return torch.load(path, weights_only=False)
+            except Exception as e:
+                print(f"skipping unreadable checkpoint {path}: {e}")
+        return None
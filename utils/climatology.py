@@ -0,0 +1,157 @@
+import json
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import torch
+
+
+class Climatology:
+    """
+    Day-of-year by time-of-day mean of the C x H x W states.
+
+    The means are kept in ``mean.npy``, a float32 memory-mapped array of
+    366 x nhour x C x H x W. Each (day, hour) slab is one contiguous chunk, so
+    ``get`` reads the climatology of a time with a single slice. ``meta.json``
+    keeps, per slab, the number of states averaged into it and the last time
+    added, so an interrupted ``build`` resumes without counting a state twice.
+
+    A slab is copied to ``stage.npy`` before it is updated. An update
+    interrupted part way is rolled back from the copy when the climatology is
+    opened again, and the state is averaged in again by ``build``, so the
+    states already averaged into the slab are kept.
+    """
+
+    def __init__(self, directory, shape=None, nhour=4):
+        """
+        Initialization.
+
+        Parameters
+        ----------
+
+        directory: str, required, the directory of the climatology;
+
+        shape: tuple of int, optional, (C, H, W) of the states, to create or
+        extend the climatology; it is opened read-only without it;
+
+        nhour: int, optional, number of times of day, evenly spaced from 00 UTC.
+        """
+        self.directory = directory
+        self.meta_path = os.path.join(directory, "meta.json")
+        path = os.path.join(directory, "mean.npy")
+        writable = shape is not None
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            if writable and meta["shape"] != list(shape):
+                raise ValueError(f"shape differs from the climatology of {directory}")
+            self.shape = tuple(meta["shape"])
+            self.nhour = meta["nhour"]
+            self.count = np.array(meta["count"], dtype=np.int64)
+            self.last = np.array(meta["last"], dtype=np.int64)
+            self.mean = np.load(path, mmap_mode="r+" if writable else "r")
+            pending = meta.get("pending")
+            if pending is not None and writable:
+                # a slab was updated only partly: its copy from before the
+                # update is restored, count and last were not updated yet
+                print("climatology: slab %s was interrupted, rolling it back" % pending)
+                self.mean[tuple(pending)] = self.stage()
+                self.mean.flush()
+                self.write_meta()
+        elif writable:
+            os.makedirs(directory, exist_ok=True)
+            self.shape = tuple(shape)
+            self.nhour = nhour
+            self.count = np.zeros((366, nhour), dtype=np.int64)
+            self.last = np.zeros((366, nhour), dtype=np.int64)
+            self.mean = np.lib.format.open_memmap(
+                path, mode="w+", dtype=np.float32, shape=(366, nhour, *self.shape)
+            )
+            self.write_meta()
+        else:
+            raise FileNotFoundError(f"no climatology in {directory}")
+
+    def write_meta(self, pending=None):
+        meta = {
+            "shape": list(self.shape),
+            "nhour": self.nhour,
+            "count": self.count.tolist(),
+            "last": self.last.tolist(),
+        }
+        if pending is not None:
+            meta["pending"] = list(pending)
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self.meta_path)
+
+    def stage(self):
+        """
+        C x H x W float32 copy of the slab being updated.
+        """
+        path = os.path.join(self.directory, "stage.npy")
+        if os.path.exists(path):
+            return np.load(path, mmap_mode="r+")
+        return np.lib.format.open_memmap(
+            path, mode="w+", dtype=np.float32, shape=self.shape
+        )
+
+    def slab(self, tstamp):
+        """
+        (day of year, time of day) index of ``tstamp``.
+        """
+        return tstamp.dayofyear - 1, tstamp.hour * self.nhour // 24
+
+    def add(self, tstamp, x):
+        """
+        Average the C x H x W state ``x`` (tensor or array) of ``tstamp`` into
+        its slab, one channel at a time.
+        """
+        d, h = self.slab(tstamp)
+        slab = self.mean[d, h]
+        stage = self.stage()
+        stage[:] = slab
+        stage.flush()
+        self.write_meta(pending=(d, h))
+        n = self.count[d, h] + 1
+        for c in range(slab.shape[0]):
+            mean = slab[c].astype(np.float64)
+            slab[c] = mean + (np.asarray(x[c], dtype=np.float64) - mean) / n
+        self.mean.flush()
+        self.count[d, h] = n
+        self.last[d, h] = tstamp.value
+        self.write_meta()
+
+    def build(self, read_state, start, end, step="6h", prefetch=2):
+        """
+        Average the states of every time from ``start`` to ``end`` every
+        ``step``, read by ``read_state(tstamp)`` with ``prefetch`` states read
+        ahead. Times up to the last one added to their slab are skipped, so a
+        build can be resumed or extended to later years.
+        """
+        times = [
+            t
+            for t in pd.date_range(start, end, freq=step)
+            if t.value > self.last[self.slab(t)]
+        ]
+        with ThreadPoolExecutor(prefetch) as pool:
+            queued = deque()
+            for t in times:
+                queued.append((t, pool.submit(read_state, t)))
+                if len(queued) > prefetch:
+                    tstamp, state = queued.popleft()
+                    self.add(tstamp, state.result())
+            while queued:
+                tstamp, state = queued.popleft()
+                self.add(tstamp, state.result())
+
+    def get(self, tstamp):
+        """
+        Returns the C x H x W climatology of ``tstamp`` as a float32 tensor.
+        """
+        d, h = self.slab(tstamp)
+        if self.count[d, h] == 0:
+            raise ValueError(f"no climatology for {tstamp}")
+        return torch.from_numpy(np.array(self.mean[d, h]))
@@ -0,0 +1,83 @@
+import json
+import os
+
+import numpy as np
+
+
+class ColumnarLog:
+    """
+    Append-only columnar log: one raw file per column (``<name>.bin``) and a
+    ``schema.json`` with the column dtypes. Rows are appended in batches with
+    ``append`` and read back as NumPy arrays with ``read``.
+
+    A crash during an append can leave the columns with different lengths;
+    ``read`` truncates them to the shortest one.
+    """
+
+    def __init__(self, directory, columns):
+        """
+        Initialization.
+
+        Parameters
+        ----------
+
+        directory: str, required, the directory of the log;
+
+        columns: dict, required, column name -> NumPy dtype string, e.g. "<f4".
+        """
+        self.directory = directory
+        self.columns = columns
+        os.makedirs(directory, exist_ok=True)
+        schema = os.path.join(directory, "schema.json")
+        if os.path.exists(schema):
+            with open(schema) as f:
+                if json.load(f) != columns:
+                    raise ValueError(f"columns differ from the schema of {directory}")
+        else:
+            with open(schema, "w") as f:
+                json.dump(columns, f)
+
+    def append(self, **values):
+        """
+        Append rows; one array-like per column, all of the same length.
+        """
+        if set(values) != set(self.columns):
+            raise ValueError(f"expected the columns {sorted(self.columns)}")
+        arrays = {
+            name: np.asarray(values[name], dtype=dtype).reshape(-1)
+            for name, dtype in self.columns.items()
+        }
+        if len({len(a) for a in arrays.values()}) > 1:
+            raise ValueError("columns of different lengths")
+        for name, array in arrays.items():
+            with open(os.path.join(self.directory, f"{name}.bin"), "ab") as f:
+                array.tofile(f)
+
+    def truncate(self, n):
+        """
+        Drop every row after the first ``n``, e.g. rows appended after the
+        checkpoint a run resumes from.
+        """
+        for name, dtype in self.columns.items():
+            path = os.path.join(self.directory, f"{name}.bin")
+            if os.path.exists(path):
+                with open(path, "r+b") as f:
+                    f.truncate(min(os.path.getsize(path), n * np.dtype(dtype).itemsize))
+
+    @staticmethod
+    def read(directory):
+        """
+        Returns a dict column name -> NumPy array.
+        """
+        with open(os.path.join(directory, "schema.json")) as f:
+            columns = json.load(f)
+        data = {}
+        for name, dtype in columns.items():
+            path = os.path.join(directory, f"{name}.bin")
+            data[name] = (
+                np.fromfile(path, dtype=dtype)
+                if os.path.exists(path)
+                else np.zeros(0, dtype=dtype)
+            )
+        n = min(len(a) for a in data.values())
+        return {name: a[:n] for name, a in data.items()}
@@ -0,0 +1,67 @@
+import numpy as np
+import torch
+import torch.distributed as dist
+
+
+def init_gloo():
+    """
+    Initialize the default process group on the gloo backend from the
+    environment set by torchrun (RANK, WORLD_SIZE, MASTER_ADDR, MASTER_PORT).
+    Returns (rank, world_size).
+    """
+    dist.init_process_group("gloo")
+    return dist.get_rank(), dist.get_world_size()
+
+
+def channel_groups(nchannel, world_size):
+    """
+    Contiguous channel slices per rank. Rank 0, the inference rank, owns no
+    channel; the others share the channels as evenly as possible.
+    """
+    bounds = np.linspace(0, nchannel, world_size).round().astype(int)
+    return [slice(0, 0)] + [
+        slice(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:], strict=True)
+    ]
+
+
+def group_size(group):
+    return group.stop - group.start
+
+
+def gather_channels(x, groups):
+    """
+    x:  c x H x W, the channels of this rank
+
+    Returns the C x H x W field on rank 0 and None on the other ranks. Blocks
+    are padded to the largest group, as gloo gathers equal sizes.
+    """
+    m = max(group_size(g) for g in groups)
+    buf = x.new_zeros((m, *x.shape[1:]))
+    buf[: x.shape[0]] = x
+    if dist.get_rank() != 0:
+        dist.gather(buf, dst=0)
+        return None
+    bufs = [torch.empty_like(buf) for _ in groups]
+    dist.gather(buf, bufs, dst=0)
+    return torch.cat([b[: group_size(g)] for b, g in zip(bufs, groups, strict=True)], 0)
+
+
+def scatter_channels(x, groups, grid):
+    """
+    x:     C x H x W field on rank 0, ignored on the other ranks
+    grid:  (H, W)
+
+    Returns the channels of this rank.
+    """
+    m = max(group_size(g) for g in groups)
+    out = torch.empty((m, *grid))
+    if dist.get_rank() == 0:
+        chunks = []
+        for g in groups:
+            chunk = torch.zeros((m, *grid))
+            chunk[: group_size(g)] = x[g]
+            chunks.append(chunk)
+        dist.scatter(out, chunks, src=0)
+    else:
+        dist.scatter(out, src=0)
+    return out[: group_size(groups[dist.get_rank()])]
@@ -0,0 +1,165 @@
+import json
+import os
+
+import numpy as np
+
+
+class ErrorMaps:
+    """
+    Per-gridpoint error statistics accumulated over an experiment.
+
+    For each kind of field (e.g. background and analysis) the sums of the
+    errors x - truth and of their squares are kept in float64 memory-mapped
+    ``.npy`` files, C x H x W each, and updated in place every cycle, one
+    channel at a time, so a cycle never holds more than a channel of float64
+    temporaries. ``export`` writes the time-mean (bias), standard deviation and
+    RMSE maps.
+
+    ``meta.json`` lists the cycles accumulated: a cycle already in it is
+    skipped, so the cycles run again after a resume are not counted twice.
+
+    An update is recoverable: the errors of the cycle are saved first, and
+    each channel is staged, then copied into the sums, with the progress in
+    ``meta.json``. An update interrupted part way is completed when the maps
+    are opened again, so no sum is lost or counted twice.
+    """
+
+    def __init__(self, directory, shape, kinds=("bg", "ana")):
+        """
+        Initialization.
+
+        Parameters
+        ----------
+
+        directory: str, required, the directory of the maps;
+
+        shape: tuple of int, required, (C, H, W) of the fields;
+
+        kinds: tuple of str, optional, the fields accumulated every cycle.
+        """
+        self.directory = directory
+        self.shape = tuple(shape)
+        self.kinds = kinds
+        os.makedirs(directory, exist_ok=True)
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.meta = {"shape": list(self.shape), "cycles": {k: [] for k in kinds}}
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            if meta["shape"] != self.meta["shape"]:
+                raise ValueError(f"shape differs from the maps of {directory}")
+            self.meta["cycles"].update(meta["cycles"])
+            if "pending" in meta:
+                self.meta["pending"] = meta["pending"]
+        self.sums = {}
+        for kind in kinds:
+            self.sums[kind] = tuple(
+                self.open(f"{kind}_{name}") for name in ("sum", "sumsq")
+            )
+        pending = self.meta.get("pending")
+        if pending is not None:
+            print(
+                "error maps: completing the interrupted update of %s at channel %d"
+                % (pending["kind"], pending["channel"])
+            )
+            self.apply()
+        self.write_meta()
+
+    def open(self, name, shape=None, dtype=np.float64):
+        path = os.path.join(self.directory, f"{name}.npy")
+        shape = self.shape if shape is None else shape
+        if os.path.exists(path):
+            return np.load(path, mmap_mode="r+")
+        return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+
+    def write_meta(self):
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self.meta_path)
+
+    def count(self, kind):
+        return len(self.meta["cycles"][kind])
+
+    def update(self, kind, cycle, x, gt):
+        """
+        Add the errors of a cycle.
+
+        kind:   one of ``kinds``
+        cycle:  cycle time in ns
+        x, gt:  C x H x W field and truth (tensors), in physical units
+        """
+        if cycle in self.meta["cycles"][kind]:
+            return
+        errors = self.open(f"{kind}_errors", dtype=np.float32)
+        for c in range(self.shape[0]):
+            errors[c] = (x[c] - gt[c]).cpu().numpy()
+        errors.flush()
+        self.meta["pending"] = {
+            "kind": kind,
+            "cycle": cycle,
+            "channel": 0,
+            "staged": False,
+        }
+        self.write_meta()
+        self.apply()
+
+    def apply(self):
+        """
+        Add the saved errors of the pending update to the sums, from the
+        channel it stopped at. A channel is staged before it is copied into the
+        sums, so a copy interrupted part way is redone from the stage.
+        """
+        pending = self.meta["pending"]
+        kind = pending["kind"]
+        s1, s2 = self.sums[kind]
+        errors = self.open(f"{kind}_errors", dtype=np.float32)
+        stage = self.open(f"{kind}_stage", shape=(2, *self.shape[1:]))
+        for c in range(pending["channel"], self.shape[0]):
+            if not pending["staged"]:
+                e = errors[c].astype(np.float64)
+                stage[0] = s1[c] + e
+                stage[1] = s2[c] + e * e
+                stage.flush()
+                pending["staged"] = True
+                self.write_meta()
+            s1[c] = stage[0]
+            s2[c] = stage[1]
+            s1.flush()
+            s2.flush()
+            pending["channel"] = c + 1
+            pending["staged"] = False
+            self.write_meta()
+        self.meta["cycles"][kind].append(pending["cycle"])
+        del self.meta["pending"]
+        self.write_meta()
+
+    def export(self, kind, directory=None):
+        """
+        Write ``<kind>_mean.npy``, ``<kind>_std.npy`` and ``<kind>_rmse.npy``,
+        float32 C x H x W maps, to ``directory`` (default: that of the maps).
+        Returns the number of cycles they are computed from.
+        """
+        directory = directory or self.directory
+        n = self.count(kind)
+        if n == 0:
+            return 0
+        s1, s2 = self.sums[kind]
+        out = {
+            name: np.lib.format.open_memmap(
+                os.path.join(directory, f"{kind}_{name}.npy"),
+                mode="w+",
+                dtype=np.float32,
+                shape=self.shape,
+            )
+            for name in ("mean", "std", "rmse")
+        }
+        for c in range(self.shape[0]):
+            mean = s1[c] / n
+            msq = s2[c] / n
+            out["mean"][c] = mean
+            out["std"][c] = np.sqrt(np.maximum(msq - mean**2, 0) * n / max(n - 1, 1))
+            out["rmse"][c] = np.sqrt(msq)
+        for m in out.values():
+            m.flush()
+        return n
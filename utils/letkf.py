@@ -0,0 +1,46 @@
+import torch
+import torch.nn.functional as F
+
+
+def gaussian_taper(radius):
+    """
+    1-D Gaussian localization weights at -radius..radius grid points, with a
+    half-width of radius / 2.
+    """
+    i = torch.arange(-radius, radius + 1, dtype=torch.float32)
+    return torch.exp(-(i**2) / (2 * (radius / 2) ** 2))
+
+
+def localize(fields, radius):
+    """
+    Sum of each field over the neighbourhood of every grid point, weighted by
+    a separable Gaussian taper; periodic in longitude, zero beyond the poles.
+
+    fields:  N x H x W
+    """
+    if radius == 0:
+        return fields
+    taper = gaussian_taper(radius).to(fields)
+    x = F.pad(fields.unsqueeze(1), (radius, radius, 0, 0), mode="circular")
+    x = F.conv2d(x, taper.reshape(1, 1, 1, -1))
+    x = F.conv2d(x, taper.reshape(1, 1, -1, 1), padding=(radius, 0))
+    return x.squeeze(1)
+
+
+def letkf_weights(A, b, nmem):
+    """
+    Batched LETKF transforms from one eigendecomposition per grid point.
+
+    A:     N x K x K, (K - 1) / inflation I + Yb^T R^-1 Yb
+    b:     N x K, Yb^T R^-1 (yo - mean)
+    nmem:  K
+
+    Returns N x K x K weights; column j, applied to the K member
+    perturbations, gives the increment of analysis member j:
+    A^-1 b + sqrt(K - 1) A^-1/2 e_j.
+    """
+    lam, V = torch.linalg.eigh(A.double())
+    Vt = V.transpose(-1, -2)
+    w_mean = V @ ((Vt @ b.double().unsqueeze(-1)) / lam.unsqueeze(-1))
+    W = V @ (torch.sqrt((nmem - 1) / lam).unsqueeze(-1) * Vt)
+    return (W + w_mean).float()
@@ -1,3 +1,6 @@
+import functools
+import types
+
 import torch
 
 
@@ -66,456 +69,107 @@ def weighted_latitude_weighting_factor_torch(
 #     return torch.mean(northern_result, dim=0), torch.mean(southern_result, dim=0), torch.mean(tropics_result, dim=0)
 
 
-# @torch.jit.script
-def type_weighted_bias_torch_channels(
-    pred: torch.Tensor, metric_type="all"
-) -> torch.Tensor:
-    # takes in arrays of size [n, c, h, w]  and returns latitude-weighted rmse for each chann
-    num_lat = pred.shape[2]
-    # num_long = target.shape[2]
-    lat_t = torch.arange(start=0, end=num_lat, device=pred.device)
+REGIONS = ("all", "northern", "southern", "tropics")
+
+# (num_lat, region, device, dtype) -> (rows, weight), see latitude_weights
+_LATITUDE_WEIGHTS = {}
 
+
+def region_rows(num_lat: int, metric_type="all"):
+    """
+    Rows of ``metric_type`` on a grid of ``num_lat`` rows from north to south,
+    and the number of rows its weights are normalized to.
+    """
     northern_index = int(110.0 / 180.0 * num_lat + 0.5)
     souther_index = int(70.0 / 180.0 * num_lat + 0.5)
-
     if metric_type == "all":
-        s = torch.sum(torch.cos(3.1416 / 180.0 * lat(lat_t, num_lat)))
-        weight = torch.reshape(
-            weighted_latitude_weighting_factor_torch(lat_t, num_lat, num_lat, s),
-            (1, 1, -1, 1),
-        )
-
-        result = torch.mean(weight * pred, dim=(-1, -2))
-
-        # result = torch.sqrt(torch.mean(weight * (pred - torch.mean(weight * pred, dim=(-1, -2), keepdim=True)) ** 2, dim=(-1, -2)))
-        return result
+        return slice(0, num_lat), num_lat
     elif metric_type == "northern":
-        northern_s = torch.sum(
-            torch.cos(3.1416 / 180.0 * lat(lat_t, num_lat))[northern_index:]
-        )
-        northern_weight = torch.reshape(
-            weighted_latitude_weighting_factor_torch(
-                lat_t[northern_index:], souther_index, num_lat, northern_s
-            ),
-            (1, 1, -1, 1),
-        )
-
-        northern_result = torch.mean(
-            northern_weight * pred[:, :, northern_index:], dim=(-1, -2)
-        )
-
-        # northern_result = torch.sqrt(torch.mean(northern_weight * (pred[:, :, northern_index:] - torch.mean(northern_weight * pred[:, :, northern_index:], dim=(-1, -2), keepdim=True)) ** 2, dim=(-1, -2)))
-        # northern_result = torch.sqrt(torch.mean(northern_weight * (pred[:, :, northern_index:] - clim_time_mean_daily[:, :, northern_index:])**2., dim=(-1,-2)))
-        return northern_result
+        return slice(northern_index, num_lat), souther_index
     elif metric_type == "southern":
-        southern_s = torch.sum(
-            torch.cos(3.1416 / 180.0 * lat(lat_t, num_lat))[:souther_index]
-        )
-        southern_weight = torch.reshape(
-            weighted_latitude_weighting_factor_torch(
-                lat_t[:souther_index], souther_index, num_lat, southern_s
-            ),
-            (1, 1, -1, 1),
-        )
-
-        southern_result = torch.mean(
-            southern_weight * pred[:, :, :souther_index], dim=(-1, -2)
-        )
-
-        # southern_result = torch.sqrt(torch.mean(southern_weight * (pred[:, :, :souther_index] - torch.mean(southern_weight * pred[:, :, :souther_index], dim=(-1, -2), keepdim=True)) ** 2, dim=(-1, -2)))
-        # southern_result = torch.sqrt(torch.mean(southern_weight * (pred[:, :, :souther_index] - clim_time_mean_daily[:, :, :souther_index])**2., dim=(-1,-2)))
-        return southern_result
-
+        return slice(0, souther_index), souther_index
     elif metric_type == "tropics":
-        tropics_s = torch.sum(
-            torch.cos(3.1416 / 180.0 * lat(lat_t, num_lat))[
-                souther_index:northern_index
-            ]
-        )
-        tropics_weight = torch.reshape(
-            weighted_latitude_weighting_factor_torch(
-                lat_t[souther_index:northern_index],
-                (northern_index - souther_index),
-                num_lat,
-                tropics_s,
-            ),
-            (1, 1, -1, 1),
-        )
-
-        tropics_result = torch.mean(
-            tropics_weight * pred[:, :, souther_index:northern_index], dim=(-1, -2)
-        )
-
-        # tropics_result = torch.sqrt(torch.mean(tropics_weight * (pred[:, :, souther_index:northern_index] - torch.mean(tropics_weight * pred[:, :, souther_index:northern_index], dim=(-1, -2), keepdim=True)) ** 2, dim=(-1, -2)))
-        # tropics_result = torch.sqrt(torch.mean(tropics_weight * (pred[:, :, souther_index:northern_index] - clim_time_mean_daily[:, :, souther_index:northern_index])**2., dim=(-1,-2)))
-        return tropics_result
+        return slice(souther_index, northern_index), northern_index - souther_index
     else:
         raise NotImplementedError
 
 
-# @torch.jit.script
-def type_weighted_anomaly_torch_channels(
-    pred: torch.Tensor, target: torch.Tensor, metric_type="all"
-) -> torch.Tensor:
-    # takes in arrays of size [n, c, h, w]  and returns latitude-weighted rmse for each chann
-    num_lat = pred.shape[2]
-    # num_long = target.shape[2]
-    lat_t = torch.arange(start=0, end=num_lat, device=pred.device)
-
-    northern_index = int(110.0 / 180.0 * num_lat + 0.5)
-    souther_index = int(70.0 / 180.0 * num_lat + 0.5)
-
-    if metric_type == "all":
-        s = torch.sum(torch.cos(3.1416 / 180.0 * lat(lat_t, num_lat)))
-        weight = torch.reshape(
-            weighted_latitude_weighting_factor_torch(lat_t, num_lat, num_lat, s),
-            (1, 1, -1, 1),
-        )
-
-        result_nume = torch.mean(
-            weight
-            * (pred - torch.mean(weight * pred, dim=(-1, -2), keepdim=True))
-            * (target - torch.mean(weight * target, dim=(-1, -2), keepdim=True))
-        )
-        result_deno = torch.sqrt(
-            torch.mean(
-                weight
-                * (pred - torch.mean(weight * pred, dim=(-1, -2), keepdim=True)) ** 2,
-                dim=(-1, -2),
-            )
-        ) * torch.sqrt(
-            torch.mean(
-                weight
-                * (target - torch.mean(weight * target, dim=(-1, -2), keepdim=True))
-                ** 2,
-                dim=(-1, -2),
-            )
-        )
-
-        result = result_nume / result_deno
-
-        # result = torch.sqrt(torch.mean(weight * (pred - torch.mean(weight * pred, dim=(-1, -2), keepdim=True)) ** 2, dim=(-1, -2)))
-        return result
-    elif metric_type == "northern":
-        northern_s = torch.sum(
-            torch.cos(3.1416 / 180.0 * lat(lat_t, num_lat))[northern_index:]
-        )
-        northern_weight = torch.reshape(
-            weighted_latitude_weighting_factor_torch(
-                lat_t[northern_index:], souther_index, num_lat, northern_s
-            ),
-            (1, 1, -1, 1),
-        )
+def latitude_weights(num_lat: int, metric_type="all", device="cpu", dtype=None):
+    """
+    Latitude weights of a region, built once per (num_lat, region, device,
+    dtype) and shared by every metric; the cached tensors must not be modified
+    in place.
 
-        northern_result_nume = torch.mean(
-            northern_weight
-            * (
-                pred[:, :, northern_index:]
-                - torch.mean(
-                    northern_weight * pred[:, :, northern_index:],
-                    dim=(-1, -2),
-                    keepdim=True,
-                )
-            )
-            * (
-                target[:, :, northern_index:]
-                - torch.mean(
-                    northern_weight * target[:, :, northern_index:],
-                    dim=(-1, -2),
-                    keepdim=True,
-                )
-            )
-        )
-        northern_result_deno = torch.sqrt(
-            torch.mean(
-                northern_weight
-                * (
-                    pred[:, :, northern_index:]
-                    - torch.mean(
-                        northern_weight * pred[:, :, northern_index:],
-                        dim=(-1, -2),
-                        keepdim=True,
-                    )
-                )
-                ** 2,
-                dim=(-1, -2),
-            )
-        ) * torch.sqrt(
-            torch.mean(
-                northern_weight
-                * (
-                    target[:, :, northern_index:]
-                    - torch.mean(
-                        northern_weight * target[:, :, northern_index:],
-                        dim=(-1, -2),
-                        keepdim=True,
-                    )
-                )
-                ** 2,
-                dim=(-1, -2),
-            )
+    Returns the rows of the region and their weights, shaped (1, 1, h, 1).
+    """
+    dtype = torch.float32 if dtype is None else dtype
+    key = (num_lat, metric_type, str(device), dtype)
+    if key not in _LATITUDE_WEIGHTS:
+        rows, real_num_lat = region_rows(num_lat, metric_type)
+        lat_t = torch.arange(start=0, end=num_lat, device=device)
+        s = torch.sum(torch.cos(3.1416 / 180.0 * lat(lat_t, num_lat))[rows])
+        weight = weighted_latitude_weighting_factor_torch(
+            lat_t[rows], real_num_lat, num_lat, s
         )
+        _LATITUDE_WEIGHTS[key] = (rows, torch.reshape(weight, (1, 1, -1, 1)).to(dtype))
+    return _LATITUDE_WEIGHTS[key]
 
-        northern_result = northern_result_nume / northern_result_deno
 
-        # northern_result = torch.sqrt(torch.mean(northern_weight * (pred[:, :, northern_index:] - torch.mean(northern_weight * pred[:, :, northern_index:], dim=(-1, -2), keepdim=True)) ** 2, dim=(-1, -2)))
-        # northern_result = torch.sqrt(torch.mean(northern_weight * (pred[:, :, northern_index:] - clim_time_mean_daily[:, :, northern_index:])**2., dim=(-1,-2)))
-        return northern_result
-    elif metric_type == "southern":
-        southern_s = torch.sum(
-            torch.cos(3.1416 / 180.0 * lat(lat_t, num_lat))[:souther_index]
-        )
-        southern_weight = torch.reshape(
-            weighted_latitude_weighting_factor_torch(
-                lat_t[:souther_index], souther_index, num_lat, southern_s
-            ),
-            (1, 1, -1, 1),
-        )
-
-        southern_result_nume = torch.mean(
-            southern_weight
-            * (
-                pred[:, :, :souther_index]
-                - torch.mean(
-                    southern_weight * pred[:, :, :souther_index],
-                    dim=(-1, -2),
-                    keepdim=True,
-                )
-            )
-            * (
-                target[:, :, :souther_index]
-                - torch.mean(
-                    southern_weight * target[:, :, :souther_index],
-                    dim=(-1, -2),
-                    keepdim=True,
-                )
-            )
-        )
-        southern_result_deno = torch.sqrt(
-            torch.mean(
-                southern_weight
-                * (
-                    pred[:, :, :souther_index]
-                    - torch.mean(
-                        southern_weight * pred[:, :, :souther_index],
-                        dim=(-1, -2),
-                        keepdim=True,
-                    )
-                )
-                ** 2,
-                dim=(-1, -2),
-            )
-        ) * torch.sqrt(
-            torch.mean(
-                southern_weight
-                * (
-                    target[:, :, :souther_index]
-                    - torch.mean(
-                        southern_weight * target[:, :, :souther_index],
-                        dim=(-1, -2),
-                        keepdim=True,
-                    )
-                )
-                ** 2,
-                dim=(-1, -2),
-            )
-        )
+def field_weights(pred: torch.Tensor, metric_type="all"):
+    """
+    latitude_weights for a field of size [n, c, h, w]; the weights are computed
+    in float32 and promoted to the dtype of the field.
+    """
+    return latitude_weights(
+        pred.shape[2],
+        metric_type,
+        pred.device,
+        torch.promote_types(pred.dtype, torch.float32),
+    )
 
-        southern_result = southern_result_nume / southern_result_deno
 
-        # southern_result = torch.sqrt(torch.mean(southern_weight * (pred[:, :, :souther_index] - torch.mean(southern_weight * pred[:, :, :souther_index], dim=(-1, -2), keepdim=True)) ** 2, dim=(-1, -2)))
-        # southern_result = torch.sqrt(torch.mean(southern_weight * (pred[:, :, :souther_index] - clim_time_mean_daily[:, :, :souther_index])**2., dim=(-1,-2)))
-        return southern_result
+# @torch.jit.script
+def type_weighted_bias_torch_channels(
+    pred: torch.Tensor, metric_type="all"
+) -> torch.Tensor:
+    # takes in arrays of size [n, c, h, w]  and returns latitude-weighted bias for each chann
+    rows, weight = field_weights(pred, metric_type)
+    return torch.mean(weight * pred[:, :, rows], dim=(-1, -2))
 
-    elif metric_type == "tropics":
-        tropics_s = torch.sum(
-            torch.cos(3.1416 / 180.0 * lat(lat_t, num_lat))[
-                souther_index:northern_index
-            ]
-        )
-        tropics_weight = torch.reshape(
-            weighted_latitude_weighting_factor_torch(
-                lat_t[souther_index:northern_index],
-                (northern_index - souther_index),
-                num_lat,
-                tropics_s,
-            ),
-            (1, 1, -1, 1),
-        )
 
-        tropics_result_nume = torch.mean(
-            tropics_weight
-            * (
-                pred[:, :, souther_index:northern_index]
-                - torch.mean(
-                    tropics_weight * pred[:, :, souther_index:northern_index],
-                    dim=(-1, -2),
-                    keepdim=True,
-                )
-            )
-            * (
-                target[:, :, souther_index:northern_index]
-                - torch.mean(
-                    tropics_weight * target[:, :, souther_index:northern_index],
-                    dim=(-1, -2),
-                    keepdim=True,
-                )
-            )
-        )
-        tropics_result_deno = torch.sqrt(
-            torch.mean(
-                tropics_weight
-                * (
-                    pred[:, :, souther_index:northern_index]
-                    - torch.mean(
-                        tropics_weight * pred[:, :, souther_index:northern_index],
-                        dim=(-1, -2),
-                        keepdim=True,
-                    )
-                )
-                ** 2,
-                dim=(-1, -2),
-            )
-        ) * torch.sqrt(
-            torch.mean(
-                tropics_weight
-                * (
-                    target[:, :, souther_index:northern_index]
-                    - torch.mean(
-                        tropics_weight * target[:, :, souther_index:northern_index],
-                        dim=(-1, -2),
-                        keepdim=True,
-                    )
-                )
-                ** 2,
-                dim=(-1, -2),
-            )
-        )
+# @torch.jit.script
+def type_weighted_anomaly_torch_channels(
+    pred: torch.Tensor, target: torch.Tensor, metric_type="all"
+) -> torch.Tensor:
+    # takes in arrays of size [n, c, h, w]  and returns latitude-weighted anomaly correlation
+    rows, weight = field_weights(pred, metric_type)
+    pred = pred[:, :, rows]
+    target = target[:, :, rows]
+    pred_anomaly = pred - torch.mean(weight * pred, dim=(-1, -2), keepdim=True)
+    target_anomaly = target - torch.mean(weight * target, dim=(-1, -2), keepdim=True)
 
-        tropics_result = tropics_result_nume / tropics_result_deno
-
-        # tropics_result = torch.sqrt(torch.mean(tropics_weight * (pred[:, :, souther_index:northern_index] - torch.mean(tropics_weight * pred[:, :, souther_index:northern_index], dim=(-1, -2), keepdim=True)) ** 2, dim=(-1, -2)))
-        # tropics_result = torch.sqrt(torch.mean(tropics_weight * (pred[:, :, souther_index:northern_index] - clim_time_mean_daily[:, :, souther_index:northern_index])**2., dim=(-1,-2)))
-        return tropics_result
-    else:
-        raise NotImplementedError
+    # the numerator is averaged over every sample and channel
+    result_nume = torch.mean(weight * pred_anomaly * target_anomaly)
+    result_deno = torch.sqrt(
+        torch.mean(weight * pred_anomaly**2, dim=(-1, -2))
+    ) * torch.sqrt(torch.mean(weight * target_anomaly**2, dim=(-1, -2)))
+    return result_nume / result_deno
 
 
 # @torch.jit.script
 def type_weighted_activity_torch_channels(
     pred: torch.Tensor, metric_type="all"
 ) -> torch.Tensor:
-    # takes in arrays of size [n, c, h, w]  and returns latitude-weighted rmse for each chann
-    num_lat = pred.shape[2]
-    # num_long = target.shape[2]
-    lat_t = torch.arange(start=0, end=num_lat, device=pred.device)
-
-    northern_index = int(110.0 / 180.0 * num_lat + 0.5)
-    souther_index = int(70.0 / 180.0 * num_lat + 0.5)
-
-    if metric_type == "all":
-        s = torch.sum(torch.cos(3.1416 / 180.0 * lat(lat_t, num_lat)))
-        weight = torch.reshape(
-            weighted_latitude_weighting_factor_torch(lat_t, num_lat, num_lat, s),
-            (1, 1, -1, 1),
-        )
-        result = torch.sqrt(
-            torch.mean(
-                weight
-                * (pred - torch.mean(weight * pred, dim=(-1, -2), keepdim=True)) ** 2,
-                dim=(-1, -2),
-            )
-        )
-        return result
-    elif metric_type == "northern":
-        northern_s = torch.sum(
-            torch.cos(3.1416 / 180.0 * lat(lat_t, num_lat))[northern_index:]
-        )
-        northern_weight = torch.reshape(
-            weighted_latitude_weighting_factor_torch(
-                lat_t[northern_index:], souther_index, num_lat, northern_s
-            ),
-            (1, 1, -1, 1),
-        )
-        northern_result = torch.sqrt(
-            torch.mean(
-                northern_weight
-                * (
-                    pred[:, :, northern_index:]
-                    - torch.mean(
-                        northern_weight * pred[:, :, northern_index:],
-                        dim=(-1, -2),
-                        keepdim=True,
-                    )
-                )
-                ** 2,
-                dim=(-1, -2),
-            )
-        )
-        # northern_result = torch.sqrt(torch.mean(northern_weight * (pred[:, :, northern_index:] - clim_time_mean_daily[:, :, northern_index:])**2., dim=(-1,-2)))
-        return northern_result
-    elif metric_type == "southern":
-        southern_s = torch.sum(
-            torch.cos(3.1416 / 180.0 * lat(lat_t, num_lat))[:souther_index]
-        )
-        southern_weight = torch.reshape(
-            weighted_latitude_weighting_factor_torch(
-                lat_t[:souther_index], souther_index, num_lat, southern_s
-            ),
-            (1, 1, -1, 1),
-        )
-        southern_result = torch.sqrt(
-            torch.mean(
-                southern_weight
-                * (
-                    pred[:, :, :souther_index]
-                    - torch.mean(
-                        southern_weight * pred[:, :, :souther_index],
-                        dim=(-1, -2),
-                        keepdim=True,
-                    )
-                )
-                ** 2,
-                dim=(-1, -2),
-            )
-        )
-        # southern_result = torch.sqrt(torch.mean(southern_weight * (pred[:, :, :souther_index] - clim_time_mean_daily[:, :, :souther_index])**2., dim=(-1,-2)))
-        return southern_result
-
-    elif metric_type == "tropics":
-        tropics_s = torch.sum(
-            torch.cos(3.1416 / 180.0 * lat(lat_t, num_lat))[
-                souther_index:northern_index
-            ]
-        )
-        tropics_weight = torch.reshape(
-            weighted_latitude_weighting_factor_torch(
-                lat_t[souther_index:northern_index],
-                (northern_index - souther_index),
-                num_lat,
-                tropics_s,
-            ),
-            (1, 1, -1, 1),
-        )
-        tropics_result = torch.sqrt(
-            torch.mean(
-                tropics_weight
-                * (
-                    pred[:, :, souther_index:northern_index]
-                    - torch.mean(
-                        tropics_weight * pred[:, :, souther_index:northern_index],
-                        dim=(-1, -2),
-                        keepdim=True,
-                    )
-                )
-                ** 2,
-                dim=(-1, -2),
-            )
+    # takes in arrays of size [n, c, h, w]  and returns latitude-weighted activity for each chann
+    rows, weight = field_weights(pred, metric_type)
+    pred = pred[:, :, rows]
+    return torch.sqrt(
+        torch.mean(
+            weight
+            * (pred - torch.mean(weight * pred, dim=(-1, -2), keepdim=True)) ** 2,
+            dim=(-1, -2),
         )
-        # tropics_result = torch.sqrt(torch.mean(tropics_weight * (pred[:, :, souther_index:northern_index] - clim_time_mean_daily[:, :, souther_index:northern_index])**2., dim=(-1,-2)))
-        return tropics_result
-    else:
-        raise NotImplementedError
+    )
 
 
 # @torch.jit.script
@@ -523,87 +177,12 @@ def type_weighted_rmse_torch_channels(
     pred: torch.Tensor, target: torch.Tensor, metric_type="all"
 ) -> torch.Tensor:
     # takes in arrays of size [n, c, h, w]  and returns latitude-weighted rmse for each chann
-    num_lat = pred.shape[2]
-    # num_long = target.shape[2]
-    lat_t = torch.arange(start=0, end=num_lat, device=pred.device)
-
-    northern_index = int(110.0 / 180.0 * num_lat + 0.5)
-    souther_index = int(70.0 / 180.0 * num_lat + 0.5)
-
-    if metric_type == "all":
-        s = torch.sum(torch.cos(3.1416 / 180.0 * lat(lat_t, num_lat)))
-        weight = torch.reshape(
-            weighted_latitude_weighting_factor_torch(lat_t, num_lat, num_lat, s),
-            (1, 1, -1, 1),
-        )
-        result = torch.sqrt(torch.mean(weight * (pred - target) ** 2.0, dim=(-1, -2)))
-        return result
-    elif metric_type == "northern":
-        northern_s = torch.sum(
-            torch.cos(3.1416 / 180.0 * lat(lat_t, num_lat))[northern_index:]
-        )
-        northern_weight = torch.reshape(
-            weighted_latitude_weighting_factor_torch(
-                lat_t[northern_index:], souther_index, num_lat, northern_s
-            ),
-            (1, 1, -1, 1),
-        )
-        northern_result = torch.sqrt(
-            torch.mean(
-                northern_weight
-                * (pred[:, :, northern_index:] - target[:, :, northern_index:]) ** 2.0,
-                dim=(-1, -2),
-            )
-        )
-        return northern_result
-    elif metric_type == "southern":
-        southern_s = torch.sum(
-            torch.cos(3.1416 / 180.0 * lat(lat_t, num_lat))[:souther_index]
-        )
-        southern_weight = torch.reshape(
-            weighted_latitude_weighting_factor_torch(
-                lat_t[:souther_index], souther_index, num_lat, southern_s
-            ),
-            (1, 1, -1, 1),
-        )
-        southern_result = torch.sqrt(
-            torch.mean(
-                southern_weight
-                * (pred[:, :, :souther_index] - target[:, :, :souther_index]) ** 2.0,
-                dim=(-1, -2),
-            )
-        )
-        return southern_result
-
-    elif metric_type == "tropics":
-        tropics_s = torch.sum(
-            torch.cos(3.1416 / 180.0 * lat(lat_t, num_lat))[
-                souther_index:northern_index
-            ]
-        )
-        tropics_weight = torch.reshape(
-            weighted_latitude_weighting_factor_torch(
-                lat_t[souther_index:northern_index],
-                (northern_index - souther_index),
-                num_lat,
-                tropics_s,
-            ),
-            (1, 1, -1, 1),
+    rows, weight = field_weights(pred, metric_type)
+    return torch.sqrt(
+        torch.mean(
+            weight * (pred[:, :, rows] - target[:, :, rows]) ** 2.0, dim=(-1, -2)
         )
-        tropics_result = torch.sqrt(
-            torch.mean(
-                tropics_weight
-                * (
-                    pred[:, :, souther_index:northern_index]
-                    - target[:, :, souther_index:northern_index]
-                )
-                ** 2.0,
-                dim=(-1, -2),
-            )
-        )
-        return tropics_result
-    else:
-        raise NotImplementedError
+    )
 
 
 # @torch.jit.script
@@ -634,24 +213,15 @@ def type_weighted_rmse_torch(
     return torch.mean(result, dim=0)
 
 
-@torch.jit.script
 def weighted_rmse_torch_channels(
     pred: torch.Tensor, target: torch.Tensor
 ) -> torch.Tensor:
     # takes in arrays of size [n, c, h, w]  and returns latitude-weighted rmse for each chann
-    num_lat = pred.shape[2]
-    # num_long = target.shape[2]
-    lat_t = torch.arange(start=0, end=num_lat, device=pred.device)
-
-    s = torch.sum(torch.cos(3.1416 / 180.0 * lat(lat_t, num_lat)))
-    weight = torch.reshape(
-        latitude_weighting_factor_torch(lat_t, num_lat, s), (1, 1, -1, 1)
-    )
+    _, weight = field_weights(pred)
     result = torch.sqrt(torch.mean(weight * (pred - target) ** 2.0, dim=(-1, -2)))
     return result
 
 
-@torch.jit.script
 def weighted_rmse_torch(pred: torch.Tensor, target: torch.Tensor) -> torch.Tensor:
     result = weighted_rmse_torch_channels(pred, target)
     return torch.mean(result, dim=0)
@@ -662,119 +232,14 @@ def type_weighted_acc_torch_channels(
     pred: torch.Tensor, target: torch.Tensor, metric_type="all"
 ) -> torch.Tensor:
     # takes in arrays of size [n, c, h, w]  and returns latitude-weighted acc
-    num_lat = pred.shape[2]
-    # num_long = target.shape[2]
-    lat_t = torch.arange(start=0, end=num_lat, device=pred.device)
-
-    northern_index = int(110.0 / 180.0 * num_lat + 0.5)
-    souther_index = int(70.0 / 180.0 * num_lat + 0.5)
-
-    if metric_type == "all":
-        s = torch.sum(torch.cos(3.1416 / 180.0 * lat(lat_t, num_lat)))
-        weight = torch.reshape(
-            latitude_weighting_factor_torch(lat_t, num_lat, s), (1, 1, -1, 1)
-        )
-        result = torch.sum(weight * pred * target, dim=(-1, -2)) / torch.sqrt(
-            torch.sum(weight * pred * pred, dim=(-1, -2))
-            * torch.sum(weight * target * target, dim=(-1, -2))
-        )
-        return result
-    elif metric_type == "northern":
-        northern_s = torch.sum(
-            torch.cos(3.1416 / 180.0 * lat(lat_t, num_lat))[northern_index:]
-        )
-        northern_weight = torch.reshape(
-            weighted_latitude_weighting_factor_torch(
-                lat_t[northern_index:], souther_index, num_lat, northern_s
-            ),
-            (1, 1, -1, 1),
-        )
-        result = torch.sum(
-            northern_weight
-            * pred[:, :, northern_index:]
-            * target[:, :, northern_index:],
-            dim=(-1, -2),
-        ) / torch.sqrt(
-            torch.sum(
-                northern_weight
-                * pred[:, :, northern_index:]
-                * pred[:, :, northern_index:],
-                dim=(-1, -2),
-            )
-            * torch.sum(
-                northern_weight
-                * target[:, :, northern_index:]
-                * target[:, :, northern_index:],
-                dim=(-1, -2),
-            )
-        )
-        return result
-    elif metric_type == "southern":
-        southern_s = torch.sum(
-            torch.cos(3.1416 / 180.0 * lat(lat_t, num_lat))[:souther_index]
-        )
-        southern_weight = torch.reshape(
-            weighted_latitude_weighting_factor_torch(
-                lat_t[:souther_index], souther_index, num_lat, southern_s
-            ),
-            (1, 1, -1, 1),
-        )
-        result = torch.sum(
-            southern_weight * pred[:, :, :souther_index] * target[:, :, :souther_index],
-            dim=(-1, -2),
-        ) / torch.sqrt(
-            torch.sum(
-                southern_weight
-                * pred[:, :, :souther_index]
-                * pred[:, :, :souther_index],
-                dim=(-1, -2),
-            )
-            * torch.sum(
-                southern_weight
-                * target[:, :, :souther_index]
-                * target[:, :, :souther_index],
-                dim=(-1, -2),
-            )
-        )
-        return result
-
-    elif metric_type == "tropics":
-        tropics_s = torch.sum(
-            torch.cos(3.1416 / 180.0 * lat(lat_t, num_lat))[
-                souther_index:northern_index
-            ]
-        )
-        tropics_weight = torch.reshape(
-            weighted_latitude_weighting_factor_torch(
-                lat_t[souther_index:northern_index],
-                (northern_index - souther_index),
-                num_lat,
-                tropics_s,
-            ),
-            (1, 1, -1, 1),
-        )
-        result = torch.sum(
-            tropics_weight
-            * pred[:, :, souther_index:northern_index]
-            * target[:, :, souther_index:northern_index],
-            dim=(-1, -2),
-        ) / torch.sqrt(
-            torch.sum(
-                tropics_weight
-                * pred[:, :, souther_index:northern_index]
-                * pred[:, :, souther_index:northern_index],
-                dim=(-1, -2),
-            )
-            * torch.sum(
-                tropics_weight
-                * target[:, :, souther_index:northern_index]
-                * target[:, :, souther_index:northern_index],
-                dim=(-1, -2),
-            )
-        )
-        return result
-    else:
-        raise NotImplementedError
+    rows, weight = field_weights(pred, metric_type)
+    pred = pred[:, :, rows]
+    target = target[:, :, rows]
+    result = torch.sum(weight * pred * target, dim=(-1, -2)) / torch.sqrt(
+        torch.sum(weight * pred * pred, dim=(-1, -2))
+        * torch.sum(weight * target * target, dim=(-1, -2))
+    )
+    return result
 
 
 # @torch.jit.script
@@ -785,18 +250,11 @@ def type_weighted_acc_torch(
     return torch.mean(result, dim=0)
 
 
-@torch.jit.script
 def weighted_acc_torch_channels(
     pred: torch.Tensor, target: torch.Tensor
 ) -> torch.Tensor:
     # takes in arrays of size [n, c, h, w]  and returns latitude-weighted acc
-    num_lat = pred.shape[2]
-    # num_long = target.shape[2]
-    lat_t = torch.arange(start=0, end=num_lat, device=pred.device)
-    s = torch.sum(torch.cos(3.1416 / 180.0 * lat(lat_t, num_lat)))
-    weight = torch.reshape(
-        latitude_weighting_factor_torch(lat_t, num_lat, s), (1, 1, -1, 1)
-    )
+    _, weight = field_weights(pred)
     result = torch.sum(weight * pred * target, dim=(-1, -2)) / torch.sqrt(
         torch.sum(weight * pred * pred, dim=(-1, -2))
         * torch.sum(weight * target * target, dim=(-1, -2))
@@ -804,12 +262,151 @@ def weighted_acc_torch_channels(
     return result
 
 
-@torch.jit.script
 def weighted_acc_torch(pred: torch.Tensor, target: torch.Tensor) -> torch.Tensor:
     result = weighted_acc_torch_channels(pred, target)
     return torch.mean(result, dim=0)
 
 
+def row_sums(pred: torch.Tensor, target: torch.Tensor, clim_mean=None, block=32):
+    """
+    Per-latitude partial sums over longitude of the error pred - target and,
+    with a climatology, of the anomalies pred - clim_mean and target -
+    clim_mean, for arrays of size [..., h, w]. Every sum is of size [..., h].
+
+    The fields are traversed once, in blocks of ``block`` rows: the error and
+    the anomalies are formed block by block, so every temporary is the size
+    of a block rather than of the fields.
+    """
+    dtype = torch.promote_types(pred.dtype, torch.float32)
+    keys = ["d", "d2", "abs"]
+    if clim_mean is not None:
+        keys += ["a", "a2", "b2", "ab"]
+    parts = {key: [] for key in keys}
+    with torch.no_grad():
+        for start in range(0, pred.shape[-2], block):
+            rows = slice(start, start + block)
+            p = pred[..., rows, :].detach().to(dtype)
+            t = target[..., rows, :].detach().to(dtype)
+            d = p - t
+            parts["d"].append(d.sum(-1))
+            parts["d2"].append(torch.einsum("...hw,...hw->...h", d, d))
+            parts["abs"].append(torch.linalg.vector_norm(d, 1, dim=-1))
+            if clim_mean is not None:
+                c = clim_mean[..., rows, :]
+                a = p - c
+                b = t - c
+                parts["a"].append(a.sum(-1))
+                parts["a2"].append(torch.einsum("...hw,...hw->...h", a, a))
+                parts["b2"].append(torch.einsum("...hw,...hw->...h", b, b))
+                parts["ab"].append(torch.einsum("...hw,...hw->...h", a, b))
+    return {key: torch.cat(value, -1).double() for key, value in parts.items()}
+
+
+def scores_from_row_sums(sums, num_lon: int, data_std=None, regions=REGIONS):
+    """
+    Regional scores from the row sums of ``row_sums``, for every region and
+    channel: wrmse, bias, mse, mae and, with a climatology, activity and acc
+    (the latitude-weighted anomaly correlation of type_weighted_acc_torch).
+
+    Returns a dict metric -> tensor of size [len(regions), ...]. wrmse, bias
+    and activity are multiplied by ``data_std`` when given, as in Metrics.
+    """
+    num_lat = sums["d"].shape[-1]
+    scores = {}
+    for region in regions:
+        rows, weight = latitude_weights(
+            num_lat, region, sums["d"].device, torch.float64
+        )
+        weight = weight.reshape(-1)
+        n = weight.numel() * num_lon
+
+        def weighted(key, rows=rows, weight=weight):
+            return torch.sum(sums[key][..., rows] * weight, -1)
+
+        def plain(key, rows=rows):
+            return torch.sum(sums[key][..., rows], -1)
+
+        region_scores = {
+            "wrmse": torch.sqrt(weighted("d2") / n),
+            "bias": weighted("d") / n,
+            "mse": plain("d2") / n,
+            "mae": plain("abs") / n,
+        }
+        if "a" in sums:
+            # sum of w (a - m)^2 with m the weighted mean of a, expanded
+            m = weighted("a") / n
+            var = (
+                weighted("a2") - 2 * m * weighted("a") + m**2 * num_lon * weight.sum()
+            ) / n
+            region_scores["activity"] = torch.sqrt(var.clamp(min=0))
+            region_scores["acc"] = weighted("ab") / torch.sqrt(
+                weighted("a2") * weighted("b2")
+            )
+        if data_std is not None:
+            for key in ("wrmse", "bias", "activity"):
+                if key in region_scores:
+                    region_scores[key] = region_scores[key] * data_std
+        for key, value in region_scores.items():
+            scores.setdefault(key, []).append(value)
+    return {key: torch.stack(value, 0) for key, value in scores.items()}
+
+
+def fused_scores(
+    pred: torch.Tensor,
+    target: torch.Tensor,
+    clim_mean=None,
+    data_std=None,
+    regions=REGIONS,
+):
+    """
+    All the regional verification scores of pred against target in a single
+    pass over the fields, see row_sums and scores_from_row_sums. The inputs
+    are read in place, without copies.
+    """
+    return scores_from_row_sums(
+        row_sums(pred, target, clim_mean), pred.shape[-1], data_std, regions
+    )
+
+
+# the weighted metric functions a backend provides
+KERNELS = (
+    "type_weighted_bias_torch",
+    "type_weighted_activity_torch",
+    "type_weighted_anomaly_torch",
+    "type_weighted_rmse_torch",
+    "type_weighted_acc_torch",
+    "weighted_rmse_torch",
+    "weighted_acc_torch",
+)
+
+
+def kernels(backend="torch"):
+    """
+    The KERNELS functions of ``backend``: "torch", those of this module, or
+    "numba", those of utils.metrics_numba, with the same signatures and
+    results, for scoring on CPU nodes.
+    """
+    if backend == "torch":
+        functions = globals()
+    elif backend == "numba":
+        from utils import metrics_numba
+
+        functions = vars(metrics_numba)
+    else:
+        raise NotImplementedError("Invalid metric backend.")
+    return types.SimpleNamespace(**{name: functions[name] for name in KERNELS})
+
+
+def channel_block(x, block):
+    """
+    Channels ``block`` of a metric input: [n, c, h, w] and [c, h, w] fields,
+    [c] or [c, 1, 1] scales; None and scalars are returned as they are.
+    """
+    if not isinstance(x, torch.Tensor) or x.dim() == 0:
+        return x
+    return x[:, block] if x.dim() == 4 else x[block]
+
+
 class Metrics:
     """
     Define metrics for evaluation, metrics include:
@@ -825,7 +422,18 @@ class Metrics:
         - Threshold, masked threshold.
     """
 
-    def __init__(self, epsilon=1e-8, **kwargs):
+    # metrics computed channel by channel, which ``evaluate`` can split into
+    # channel blocks
+    PER_CHANNEL = {
+        "Channel_MSE",
+        *(
+            region + name
+            for region in ("", "N", "S", "T")
+            for name in ("Bias", "Activity", "WRMSE", "WACC")
+        ),
+    }
+
+    def __init__(self, epsilon=1e-8, chunk=0, backend="torch", **kwargs):
         """
         Initialization.
 
@@ -833,9 +441,41 @@ class Metrics:
         ----------
 
         epsilon: float, optional, default: 1e-8, the epsilon used in the metric calculation.
+
+        chunk: int, optional, default: 0, number of channels evaluated at once
+        by ``evaluate``, 0 for all.
+
+        backend: str, optional, default: "torch", the weighted metric
+        functions used, see ``kernels``.
         """
         super(Metrics, self).__init__()
         self.epsilon = epsilon
+        self.chunk = chunk
+        self.kernels = kernels(backend)
+
+    def evaluate(self, metric, pred, gt, data_mask, clim_time_mean_daily, data_std):
+        """
+        The metric named ``metric``. With ``chunk`` set, per-channel metrics
+        are evaluated over blocks of ``chunk`` channels, so their temporaries
+        are the size of one block rather than of the whole batch; each channel
+        is computed as without blocks, so the results are the same.
+        """
+        func = getattr(self, metric)
+        nchannel = pred.shape[1]
+        if not self.chunk or metric not in self.PER_CHANNEL or nchannel <= self.chunk:
+            return func(pred, gt, data_mask, clim_time_mean_daily, data_std)
+        results = []
+        for start in range(0, nchannel, self.chunk):
+            block = slice(start, start + self.chunk)
+            results.append(
+                func(
+                    *(
+                        channel_block(x, block)
+                        for x in (pred, gt, data_mask, clim_time_mean_daily, data_std)
+                    )
+                )
+            )
+        return torch.cat(results, 0)
 
     def MSE(self, pred, gt, data_mask, clim_time_mean_daily, data_std):
         """
@@ -921,26 +561,40 @@ class Metrics:
     #     return weighted_rmse_torch(pred, gt)
 
     def Bias(self, pred, gt, data_mask, clim_time_mean_daily, data_std):
-        return type_weighted_bias_torch(pred - gt, metric_type="all") * data_std
+        return (
+            self.kernels.type_weighted_bias_torch(pred - gt, metric_type="all")
+            * data_std
+        )
 
     def NBias(self, pred, gt, data_mask, clim_time_mean_daily, data_std):
-        return type_weighted_bias_torch(pred - gt, metric_type="northern") * data_std
+        return (
+            self.kernels.type_weighted_bias_torch(pred - gt, metric_type="northern")
+            * data_std
+        )
 
     def SBias(self, pred, gt, data_mask, clim_time_mean_daily, data_std):
-        return type_weighted_bias_torch(pred - gt, metric_type="southern") * data_std
+        return (
+            self.kernels.type_weighted_bias_torch(pred - gt, metric_type="southern")
+            * data_std
+        )
 
     def TBias(self, pred, gt, data_mask, clim_time_mean_daily, data_std):
-        return type_weighted_bias_torch(pred - gt, metric_type="tropics") * data_std
+        return (
+            self.kernels.type_weighted_bias_torch(pred - gt, metric_type="tropics")
+            * data_std
+        )
 
     def Activity(self, pred, gt, data_mask, clim_time_mean_daily, data_std):
         return (
-            type_weighted_activity_torch(pred - clim_time_mean_daily, metric_type="all")
+            self.kernels.type_weighted_activity_torch(
+                pred - clim_time_mean_daily, metric_type="all"
+            )
             * data_std
         )
 
     def NActivity(self, pred, gt, data_mask, clim_time_mean_daily, data_std):
         return (
-            type_weighted_activity_torch(
+            self.kernels.type_weighted_activity_torch(
                 pred - clim_time_mean_daily, metric_type="northern"
             )
             * data_std
@@ -948,7 +602,7 @@ class Metrics:
 
     def SActivity(self, pred, gt, data_mask, clim_time_mean_daily, data_std):
         return (
-            type_weighted_activity_torch(
+            self.kernels.type_weighted_activity_torch(
                 pred - clim_time_mean_daily, metric_type="southern"
             )
             * data_std
@@ -956,46 +610,55 @@ class Metrics:
 
     def TActivity(self, pred, gt, data_mask, clim_time_mean_daily, data_std):
         return (
-            type_weighted_activity_torch(
+            self.kernels.type_weighted_activity_torch(
                 pred - clim_time_mean_daily, metric_type="tropics"
             )
             * data_std
         )
 
     def Anomaly(self, pred, gt, data_mask, clim_time_mean_daily, data_std):
-        return type_weighted_anomaly_torch(
+        return self.kernels.type_weighted_anomaly_torch(
             pred - clim_time_mean_daily, gt - clim_time_mean_daily, metric_type="all"
         )
 
     def NAnomaly(self, pred, gt, data_mask, clim_time_mean_daily, data_std):
-        return type_weighted_anomaly_torch(
+        return self.kernels.type_weighted_anomaly_torch(
             pred - clim_time_mean_daily,
             gt - clim_time_mean_daily,
             metric_type="northern",
         )
 
     def SAnomaly(self, pred, gt, data_mask, clim_time_mean_daily, data_std):
-        return type_weighted_anomaly_torch(
+        return self.kernels.type_weighted_anomaly_torch(
             pred - clim_time_mean_daily,
             gt - clim_time_mean_daily,
             metric_type="southern",
         )
 
     def TAnomaly(self, pred, gt, data_mask, clim_time_mean_daily, data_std):
-        return type_weighted_anomaly_torch(
+        return self.kernels.type_weighted_anomaly_torch(
             pred - clim_time_mean_daily,
             gt - clim_time_mean_daily,
             metric_type="tropics",
         )
 
     def NWRMSE(self, pred, gt, data_mask, clim_time_mean_daily, data_std):
-        return type_weighted_rmse_torch(pred, gt, metric_type="northern") * data_std
+        return (
+            self.kernels.type_weighted_rmse_torch(pred, gt, metric_type="northern")
+            * data_std
+        )
 
     def SWRMSE(self, pred, gt, data_mask, clim_time_mean_daily, data_std):
-        return type_weighted_rmse_torch(pred, gt, metric_type="southern") * data_std
+        return (
+            self.kernels.type_weighted_rmse_torch(pred, gt, metric_type="southern")
+            * data_std
+        )
 
     def TWRMSE(self, pred, gt, data_mask, clim_time_mean_daily, data_std):
-        return type_weighted_rmse_torch(pred, gt, metric_type="tropics") * data_std
+        return (
+            self.kernels.type_weighted_rmse_torch(pred, gt, metric_type="tropics")
+            * data_std
+        )
 
     def WRMSE(self, pred, gt, data_mask, clim_time_mean_daily, data_std):
         """
@@ -1015,7 +678,7 @@ class Metrics:
         The WRMSE metric.
         """
 
-        return weighted_rmse_torch(pred, gt) * data_std
+        return self.kernels.weighted_rmse_torch(pred, gt) * data_std
 
     # def WACC(self, pred, gt, data_mask, clim_time_mean_daily, data_std):
     #     """
@@ -1036,21 +699,21 @@ class Metrics:
     #     return weighted_acc_torch(pred, gt)
 
     def NWACC(self, pred, gt, data_mask, clim_time_mean_daily, data_std):
-        return type_weighted_acc_torch(
+        return self.kernels.type_weighted_acc_torch(
             pred - clim_time_mean_daily,
             gt - clim_time_mean_daily,
             metric_type="northern",
         )
 
     def SWACC(self, pred, gt, data_mask, clim_time_mean_daily, data_std):
-        return type_weighted_acc_torch(
+        return self.kernels.type_weighted_acc_torch(
             pred - clim_time_mean_daily,
             gt - clim_time_mean_daily,
             metric_type="southern",
         )
 
     def TWACC(self, pred, gt, data_mask, clim_time_mean_daily, data_std):
-        return type_weighted_acc_torch(
+        return self.kernels.type_weighted_acc_torch(
             pred - clim_time_mean_daily,
             gt - clim_time_mean_daily,
             metric_type="tropics",
@@ -1074,7 +737,7 @@ class Metrics:
         The WACC metric.
         """
 
-        return weighted_acc_torch(
+        return self.kernels.weighted_acc_torch(
             pred - clim_time_mean_daily, gt - clim_time_mean_daily
         )
 
@@ -1082,9 +745,13 @@ class Metrics:
 class MetricsRecorder:
     """
     Metrics Recorder.
+
+    ``evaluate_batch`` returns the scores of a batch as one metric x channel
+    tensor, with the rows in the order of ``metrics_list`` (see ``index``), and
+    accumulates them, weighted by the batch size, for ``mean`` and ``std``.
     """
 
-    def __init__(self, metrics_list, epsilon=1e-7, **kwargs):
+    def __init__(self, metrics_list, epsilon=1e-7, chunk=0, backend="torch", **kwargs):
         """
         Initialization.
 
@@ -1094,18 +761,37 @@ class MetricsRecorder:
         metrics_list: list of str, required, the metrics name list used in the metric calcuation.
 
         epsilon: float, optional, default: 1e-8, the epsilon used in the metric calculation.
+
+        chunk: int, optional, default: 0, number of channels per-channel
+        metrics are evaluated at once, 0 for all (see Metrics.evaluate).
+
+        backend: str, optional, default: "torch", the backend of the weighted
+        metrics (see kernels).
         """
         super(MetricsRecorder, self).__init__()
         self.epsilon = epsilon
-        self.metrics = Metrics(epsilon=epsilon)
+        self.metrics = Metrics(epsilon=epsilon, chunk=chunk, backend=backend)
         self.metric_str_list = metrics_list
         self.metrics_list = []
         for metric in metrics_list:
-            try:
-                metric_func = getattr(self.metrics, metric)
-                self.metrics_list.append([metric, metric_func, {}])
-            except Exception:
+            if not callable(getattr(self.metrics, metric, None)):
                 raise NotImplementedError("Invalid metric type.")
+            self.metrics_list.append(
+                [metric, functools.partial(self.metrics.evaluate, metric), {}]
+            )
+        # metric name -> row of the scores
+        self.index = {metric: i for i, metric in enumerate(metrics_list)}
+        # whether a metric has one score per channel, set by evaluate_batch
+        self.per_channel = [True] * len(metrics_list)
+        self.reset()
+
+    def reset(self):
+        """
+        Clear the scores accumulated over the batches.
+        """
+        self.count = 0
+        self.total = None
+        self.total_sq = None
 
     def evaluate_batch(self, data_dict):
         """
@@ -1114,13 +800,15 @@ class MetricsRecorder:
         Parameters
         ----------
 
-        data_dict: pred and gt
+        data_dict: pred and gt, optionally clim_mean (the climatology) and std
+        (the channel scales of WRMSE, Bias and Activity)
 
 
         Returns
         -------
 
-        The metrics dict.
+        The metric x channel float64 tensor of the scores; metrics without a
+        channel dimension are repeated along it.
         """
         pred = data_dict["pred"]  # (B, C, H, W)
         gt = data_dict["gt"]
@@ -1129,18 +817,61 @@ class MetricsRecorder:
         data_std = None
         if "clim_mean" in data_dict:
             clim_time_mean_daily = data_dict["clim_mean"]  # (C, H, W)
-            data_std = data_dict["std"]
+        if "std" in data_dict:
+            data_std = data_dict["std"]  # (C,)
 
-        losses = {}
-        for metric_line in self.metrics_list:
+        nchannel = pred.shape[1]
+        rows = []
+        for i, metric_line in enumerate(self.metrics_list):
             metric_name, metric_func, metric_kwargs = metric_line
             loss = metric_func(pred, gt, data_mask, clim_time_mean_daily, data_std)
-            if isinstance(loss, torch.Tensor):
-                for i in range(len(loss)):
-                    losses[metric_name + str(i)] = loss[i].item()
-            else:
-                losses[metric_name] = loss
+            loss = torch.as_tensor(loss, dtype=torch.float64, device=pred.device)
+            if loss.dim() > 0 and loss.numel() != nchannel:
+                raise ValueError(
+                    "%s gives %d values, not one per channel"
+                    % (metric_name, loss.numel())
+                )
+            self.per_channel[i] = loss.dim() > 0
+            rows.append(loss.detach().reshape(-1).expand(nchannel))
+        # a single transfer for the whole batch
+        scores = torch.stack(rows, 0).cpu()
+
+        n = pred.shape[0]
+        if self.total is None:
+            self.total = torch.zeros_like(scores)
+            self.total_sq = torch.zeros_like(scores)
+        self.total += n * scores
+        self.total_sq += n * scores**2
+        self.count += n
+        return scores
+
+    def mean(self):
+        """
+        Metric x channel mean of the scores over the samples of every batch.
+        """
+        return self.total / self.count
+
+    def std(self):
+        """
+        Metric x channel standard deviation of the batch scores, weighted by
+        the batch sizes.
+        """
+        mean = self.mean()
+        return torch.sqrt(torch.clamp(self.total_sq / self.count - mean**2, min=0))
 
+    def as_dict(self, scores):
+        """
+        The scores of evaluate_batch as a dict of floats keyed by metric name,
+        suffixed with the channel for per-channel metrics (e.g. "WRMSE11").
+        """
+        values = scores.tolist()
+        losses = {}
+        for i, metric in enumerate(self.metric_str_list):
+            if self.per_channel[i]:
+                for c, value in enumerate(values[i]):
+                    losses[metric + str(c)] = value
+            else:
+                losses[metric] = values[i][0]
         return losses
 
 
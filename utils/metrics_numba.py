@@ -0,0 +1,238 @@
+"""
+Numba backend of the latitude-weighted metrics of utils.metrics.
+
+The functions have the names and signatures of their torch counterparts and
+are selected with Metrics(backend="numba"). Each metric is one parallel pass
+over NumPy views of the fields, over the (sample, channel) planes, that
+accumulates the weighted sums it needs in float64; the metric is then
+expanded from the sums, without full-size temporaries. Fields on a GPU are
+copied to the host first, so this backend is meant for CPU nodes.
+"""
+
+import numba
+import numpy as np
+import torch
+
+from utils.metrics import latitude_weights
+
+
+@numba.njit(parallel=True, cache=True)
+def weighted_square_error(p, t, w):
+    """
+    Sum over each plane of w * (p - t)^2, for n x c x h x w fields and the
+    weights w of the h rows. Returns n x c float64.
+    """
+    n, c, h, nlon = p.shape
+    out = np.zeros(n * c)
+    for k in numba.prange(n * c):
+        i = k // c
+        j = k % c
+        s = 0.0
+        for y in range(h):
+            r = 0.0
+            for x in range(nlon):
+                d = np.float64(p[i, j, y, x]) - np.float64(t[i, j, y, x])
+                r += d * d
+            s += w[y] * r
+        out[k] = s
+    return out.reshape(n, c)
+
+
+@numba.njit(parallel=True, cache=True)
+def weighted_moments(p, w):
+    """
+    Sums over each plane of w * p and w * p^2. Returns n x c x 2 float64.
+    """
+    n, c, h, nlon = p.shape
+    out = np.zeros((n * c, 2))
+    for k in numba.prange(n * c):
+        i = k // c
+        j = k % c
+        s1 = 0.0
+        s2 = 0.0
+        for y in range(h):
+            r1 = 0.0
+            r2 = 0.0
+            for x in range(nlon):
+                a = np.float64(p[i, j, y, x])
+                r1 += a
+                r2 += a * a
+            s1 += w[y] * r1
+            s2 += w[y] * r2
+        out[k, 0] = s1
+        out[k, 1] = s2
+    return out.reshape(n, c, 2)
+
+
+@numba.njit(parallel=True, cache=True)
+def weighted_cross_moments(p, t, w):
+    """
+    Sums over each plane of w * p, w * t, w * p^2, w * t^2 and w * p * t.
+    Returns n x c x 5 float64.
+    """
+    n, c, h, nlon = p.shape
+    out = np.zeros((n * c, 5))
+    for k in numba.prange(n * c):
+        i = k // c
+        j = k % c
+        s = np.zeros(5)
+        for y in range(h):
+            r0 = 0.0
+            r1 = 0.0
+            r2 = 0.0
+            r3 = 0.0
+            r4 = 0.0
+            for x in range(nlon):
+                a = np.float64(p[i, j, y, x])
+                b = np.float64(t[i, j, y, x])
+                r0 += a
+                r1 += b
+                r2 += a * a
+                r3 += b * b
+                r4 += a * b
+            s[0] += w[y] * r0
+            s[1] += w[y] * r1
+            s[2] += w[y] * r2
+            s[3] += w[y] * r3
+            s[4] += w[y] * r4
+        out[k] = s
+    return out.reshape(n, c, 5)
+
+
+def host_view(x, rows):
+    """
+    NumPy view of the rows of an [n, c, h, w] tensor; copied only if it is
+    not on the host or of a dtype NumPy lacks.
+    """
+    x = x.detach()
+    if x.dtype not in (torch.float32, torch.float64):
+        x = x.float()
+    return x.cpu().numpy()[:, :, rows]
+
+
+def region(pred, metric_type):
+    """
+    Rows, float64 weights of the rows, number of points of the region, and a
+    function returning a result as a tensor of the dtype and device the torch
+    version gives.
+    """
+    rows, weight = latitude_weights(pred.shape[2], metric_type, "cpu", torch.float64)
+    weight = weight.reshape(-1).numpy()
+    dtype = torch.promote_types(pred.dtype, torch.float32)
+
+    def result(x):
+        return torch.from_numpy(np.asarray(x)).to(device=pred.device, dtype=dtype)
+
+    return rows, weight, weight.size * pred.shape[3], result
+
+
+def centered(s1, s2, sw, n):
+    """
+    Sum of w (x - m)^2 from the sums of w x and w x^2, with m = s1 / n the
+    mean of w x as in the torch metrics and sw the sum of the weights.
+    """
+    m = s1 / n
+    return s2 - 2 * m * s1 + m**2 * sw
+
+
+def type_weighted_bias_torch_channels(
+    pred: torch.Tensor, metric_type="all"
+) -> torch.Tensor:
+    rows, weight, n, result = region(pred, metric_type)
+    s = weighted_moments(host_view(pred, rows), weight)
+    return result(s[..., 0] / n)
+
+
+def type_weighted_activity_torch_channels(
+    pred: torch.Tensor, metric_type="all"
+) -> torch.Tensor:
+    rows, weight, n, result = region(pred, metric_type)
+    s = weighted_moments(host_view(pred, rows), weight)
+    sw = weight.sum() * pred.shape[3]
+    return result(np.sqrt(np.maximum(centered(s[..., 0], s[..., 1], sw, n), 0) / n))
+
+
+def type_weighted_anomaly_torch_channels(
+    pred: torch.Tensor, target: torch.Tensor, metric_type="all"
+) -> torch.Tensor:
+    rows, weight, n, result = region(pred, metric_type)
+    s = weighted_cross_moments(host_view(pred, rows), host_view(target, rows), weight)
+    sw = weight.sum() * pred.shape[3]
+    mp = s[..., 0] / n
+    mt = s[..., 1] / n
+    cov = s[..., 4] - mt * s[..., 0] - mp * s[..., 1] + mp * mt * sw
+    # the numerator is averaged over every sample and channel
+    result_nume = cov.sum() / (cov.size * n)
+    result_deno = np.sqrt(centered(s[..., 0], s[..., 2], sw, n) / n) * np.sqrt(
+        centered(s[..., 1], s[..., 3], sw, n) / n
+    )
+    return result(result_nume / result_deno)
+
+
+def type_weighted_rmse_torch_channels(
+    pred: torch.Tensor, target: torch.Tensor, metric_type="all"
+) -> torch.Tensor:
+    rows, weight, n, result = region(pred, metric_type)
+    s = weighted_square_error(host_view(pred, rows), host_view(target, rows), weight)
+    return result(np.sqrt(s / n))
+
+
+def type_weighted_acc_torch_channels(
+    pred: torch.Tensor, target: torch.Tensor, metric_type="all"
+) -> torch.Tensor:
+    rows, weight, n, result = region(pred, metric_type)
+    s = weighted_cross_moments(host_view(pred, rows), host_view(target, rows), weight)
+    return result(s[..., 4] / np.sqrt(s[..., 2] * s[..., 3]))
+
+
+def type_weighted_activity_torch(pred: torch.Tensor, metric_type="all") -> torch.Tensor:
+    result = type_weighted_activity_torch_channels(pred, metric_type=metric_type)
+    return torch.mean(result, dim=0)
+
+
+def type_weighted_bias_torch(pred: torch.Tensor, metric_type="all") -> torch.Tensor:
+    result = type_weighted_bias_torch_channels(pred, metric_type=metric_type)
+    return torch.mean(result, dim=0)
+
+
+def type_weighted_anomaly_torch(
+    pred: torch.Tensor, target: torch.Tensor, metric_type="all"
+) -> torch.Tensor:
+    result = type_weighted_anomaly_torch_channels(pred, target, metric_type=metric_type)
+    return torch.mean(result, dim=0)
+
+
+def type_weighted_rmse_torch(
+    pred: torch.Tensor, target: torch.Tensor, metric_type="all"
+) -> torch.Tensor:
+    result = type_weighted_rmse_torch_channels(pred, target, metric_type=metric_type)
+    return torch.mean(result, dim=0)
+
+
+def type_weighted_acc_torch(
+    pred: torch.Tensor, target: torch.Tensor, metric_type="all"
+) -> torch.Tensor:
+    result = type_weighted_acc_torch_channels(pred, target, metric_type=metric_type)
+    return torch.mean(result, dim=0)
+
+
+def weighted_rmse_torch_channels(
+    pred: torch.Tensor, target: torch.Tensor
+) -> torch.Tensor:
+    return type_weighted_rmse_torch_channels(pred, target)
+
+
+def weighted_rmse_torch(pred: torch.Tensor, target: torch.Tensor) -> torch.Tensor:
+    result = weighted_rmse_torch_channels(pred, target)
+    return torch.mean(result, dim=0)
+
+
+def weighted_acc_torch_channels(
+    pred: torch.Tensor, target: torch.Tensor
+) -> torch.Tensor:
+    return type_weighted_acc_torch_channels(pred, target)
+
+
+def weighted_acc_torch(pred: torch.Tensor, target: torch.Tensor) -> torch.Tensor:
+    result = weighted_acc_torch_channels(pred, target)
+    return torch.mean(result, dim=0)
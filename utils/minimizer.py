@@ -0,0 +1,406 @@
+import time
+from collections import deque
+
+import torch
+import torch.optim as optim
+
+
+def dot(a, b):
+    return torch.sum(a * b, dtype=torch.float64).item()
+
+
+class Minimizer:
+    """
+    Base class of the minimizers used by the variational DA modes.
+
+    ``step`` runs one outer iteration. ``closure`` evaluates the cost at the
+    current control variable and sets its ``.grad`` (zeroing it first). After
+    each step, ``stop_reason`` is set once one of the stopping criteria is met:
+
+        - "gtol": gradient norm below ``gtol`` times the initial one;
+
+        - "ftol": relative cost reduction of the last step below ``ftol``;
+          CG and Lanczos measure it on the cost of their quadratic model,
+          not on the true cost evaluated by ``closure`` as LBFGS does;
+
+        - "max_eval": ``max_eval`` cost evaluations and Hessian-vector
+          products used, as CG and Lanczos spend their work in the latter;
+
+        - "max_time": wall clock past ``deadline``.
+
+    A criterion with a value of 0 / None is disabled.
+
+    ``curvature_pairs`` returns the pairs (s, H s) met during the minimization,
+    for preconditioning later minimizations with the same Hessian.
+    """
+
+    def __init__(self, w, gtol=0.0, ftol=0.0, max_eval=0, deadline=None, n_pairs=0):
+        """
+        Initialization.
+
+        Parameters
+        ----------
+
+        w: tensor, required, the control variable, updated in place;
+
+        gtol: float, optional, relative gradient-norm reduction to stop at;
+
+        ftol: float, optional, relative cost reduction per step to stop at, of
+        ``f``: the cost of the last evaluation for LBFGS, the quadratic model
+        cost for CG and Lanczos;
+
+        max_eval: int, optional, budget of cost evaluations and Hessian-vector
+        products;
+
+        deadline: float, optional, time.time() after which to stop;
+
+        n_pairs: int, optional, number of the latest curvature pairs to keep.
+        """
+        self.w = w
+        self.gtol = gtol
+        self.ftol = ftol
+        self.max_eval = max_eval
+        self.deadline = deadline
+        self.n_eval = 0
+        self.n_hvp = 0
+        self.f = None
+        self.g_norm = None
+        self.g0_norm = None
+        self.stop_reason = None
+        self.pairs = deque(maxlen=n_pairs)
+
+    def evaluate(self, closure):
+        f = closure()
+        self.n_eval += 1
+        self.f = float(f)
+        self.g_norm = torch.linalg.vector_norm(self.w.grad).item()
+        if self.g0_norm is None:
+            self.g0_norm = self.g_norm
+        return f
+
+    def check(self, f_prev):
+        if self.gtol and self.g_norm <= self.gtol * self.g0_norm:
+            self.stop_reason = "gtol"
+        elif self.ftol and f_prev - self.f <= self.ftol * abs(f_prev):
+            self.stop_reason = "ftol"
+        elif self.max_eval and self.n_eval + self.n_hvp >= self.max_eval:
+            self.stop_reason = "max_eval"
+        elif self.deadline is not None and time.time() >= self.deadline:
+            self.stop_reason = "max_time"
+        return self.stop_reason
+
+    def step(self, closure):
+        raise NotImplementedError
+
+    def curvature_pairs(self):
+        return list(self.pairs)
+
+
+class LBFGSMinimizer(Minimizer):
+    """
+    torch.optim.LBFGS with a strong-Wolfe line search; one step runs up to
+    ``max_iter`` LBFGS iterations.
+    """
+
+    def __init__(self, w, history_size=10, max_iter=5, **kwargs):
+        super().__init__(w, **kwargs)
+        self.optimizer = optim.LBFGS(
+            [w],
+            history_size=history_size,
+            max_iter=max_iter,
+            line_search_fn="strong_wolfe",
+        )
+
+    def step(self, closure):
+        f_start = []
+
+        def counted_closure():
+            f = self.evaluate(closure)
+            if not f_start:
+                f_start.append(self.f)
+            return f
+
+        self.optimizer.step(counted_closure)
+        self.check(f_start[0])
+
+        state = self.optimizer.state[self.w]
+        info = {"n_eval": self.n_eval}
+        # no direction is stored if the first gradient converged
+        if "d" in state:
+            info["step_length"] = float(state["t"])
+            info["step_norm"] = (
+                float(state["t"]) * torch.linalg.vector_norm(state["d"]).item()
+            )
+        return info
+
+    def curvature_pairs(self):
+        # the LBFGS memory itself: steps s and gradient differences y = H s
+        state = self.optimizer.state[self.w]
+        pairs = zip(state.get("old_stps", []), state.get("old_dirs", []), strict=True)
+        return [(s.view_as(self.w), y.view_as(self.w)) for s, y in pairs]
+
+
+class CGMinimizer(Minimizer):
+    """
+    Conjugate gradient for a quadratic cost. Each step uses one Hessian-vector
+    product ``hvp`` and no cost evaluation; the cost and the gradient are
+    updated from the quadratic model after the first evaluation. As for
+    Lanczos, preconditioning is a change of the control variable by the
+    caller, folded into the cost and ``hvp``.
+    """
+
+    def __init__(self, w, hvp, **kwargs):
+        """
+        hvp:      v -> Hessian of the cost times v
+        """
+        super().__init__(w, **kwargs)
+        self.hvp = hvp
+        self.g = None
+
+    def step(self, closure):
+        if self.g is None:
+            self.evaluate(closure)
+            self.g = self.w.grad.detach().clone()
+            self.d = -self.g
+            self.gg = dot(self.g, self.g)
+        f_prev = self.f
+
+        Hd = self.hvp(self.d)
+        self.n_hvp += 1
+        self.pairs.append((self.d, Hd))
+        dHd = dot(self.d, Hd)
+        alpha = self.gg / dHd
+        with torch.no_grad():
+            self.w.add_(self.d, alpha=alpha)
+        self.f = self.f + alpha * dot(self.g, self.d) + alpha**2 * dHd / 2
+        self.g.add_(Hd, alpha=alpha)
+        self.g_norm = torch.linalg.vector_norm(self.g).item()
+        step_norm = abs(alpha) * torch.linalg.vector_norm(self.d).item()
+
+        gg = dot(self.g, self.g)
+        self.d = -self.g + gg / self.gg * self.d
+        self.gg = gg
+
+        self.check(f_prev)
+        return {
+            "n_eval": self.n_eval,
+            "n_hvp": self.n_hvp,
+            "step_length": alpha,
+            "step_norm": step_norm,
+        }
+
+
+class LanczosMinimizer(Minimizer):
+    """
+    Lanczos form of conjugate gradient for a quadratic cost. Each step adds
+    one Lanczos vector (one Hessian-vector product), solves the projected
+    tridiagonal system and sets the control variable to its solution. The
+    Lanczos vectors are kept (one field per step), which allows the Ritz
+    pairs of the Hessian to be extracted with ``ritz``.
+    """
+
+    def __init__(self, w, hvp, **kwargs):
+        super().__init__(w, **kwargs)
+        self.hvp = hvp
+        self.Q = []
+        self.alpha = []
+        self.beta = []
+
+    def tridiagonal(self):
+        k = len(self.alpha)
+        T = torch.zeros(k, k, dtype=torch.float64)
+        for i in range(k):
+            T[i, i] = self.alpha[i]
+            if i + 1 < k:
+                T[i, i + 1] = T[i + 1, i] = self.beta[i + 1]
+        return T
+
+    def step(self, closure):
+        if not self.Q:
+            self.evaluate(closure)
+            self.w0 = self.w.detach().clone()
+            self.f0 = self.f
+            g = self.w.grad.detach()
+            self.beta = [torch.linalg.vector_norm(g).item()]
+            self.Q = [-g / self.beta[0]]
+        f_prev = self.f
+
+        q = self.Q[-1]
+        v = self.hvp(q)
+        self.n_hvp += 1
+        self.pairs.append((q, v))
+        self.alpha.append(dot(q, v))
+        # full reorthogonalization against the stored basis
+        for qi in self.Q:
+            v = v - dot(qi, v) * qi
+        self.beta.append(torch.linalg.vector_norm(v).item())
+
+        k = len(self.alpha)
+        rhs = torch.zeros(k, dtype=torch.float64)
+        rhs[0] = self.beta[0]
+        y = torch.linalg.solve(self.tridiagonal(), rhs)
+        with torch.no_grad():
+            self.w.copy_(self.w0)
+            for yi, qi in zip(y.tolist(), self.Q, strict=True):
+                self.w.add_(qi, alpha=yi)
+        self.f = self.f0 - self.beta[0] * y[0].item() / 2
+        self.g_norm = self.beta[-1] * abs(y[-1].item())
+
+        if self.beta[-1] > 0:
+            self.Q.append(v / self.beta[-1])
+        else:
+            self.stop_reason = "gtol"
+        self.check(f_prev)
+        return {
+            "n_eval": self.n_eval,
+            "n_hvp": self.n_hvp,
+            "lanczos_alpha": self.alpha[-1],
+            "lanczos_beta": self.beta[-1],
+        }
+
+    def ritz(self):
+        """
+        Returns the Ritz values (ascending) and the Ritz vectors of the Hessian
+        from the Lanczos vectors built so far.
+        """
+        theta, S = torch.linalg.eigh(self.tridiagonal())
+        vectors = [
+            sum(s * qi for s, qi in zip(S[:, j].tolist(), self.Q, strict=False))
+            for j in range(len(theta))
+        ]
+        return theta.tolist(), vectors
+
+
+class SymmetricOperator(torch.autograd.Function):
+    """
+    Applies a symmetric linear operator ``op``; the backward pass is the same
+    operator, so no intermediate is kept for autograd.
+    """
+
+    @staticmethod
+    def forward(ctx, v, op):
+        ctx.op = op
+        return op(v)
+
+    @staticmethod
+    def backward(ctx, grad):
+        return ctx.op(grad), None
+
+
+class SpectralPreconditioner:
+    """
+    Spectral limited-memory preconditioner P = I + sum_j (1 / theta_j - 1)
+    u_j u_j^T of a Hessian with Ritz pairs (theta_j, u_j), u_j = S C[:, j]
+    for a basis S kept in float16. Minimizing over v with w = P^1/2 v turns
+    the Hessian into P^1/2 A P^1/2, whose eigenvalues theta_j are mapped to 1.
+    """
+
+    def __init__(self, basis, coeffs, theta):
+        self.basis = basis
+        self.coeffs = coeffs
+        self.theta = theta
+
+    def __len__(self):
+        return len(self.theta)
+
+    def apply(self, v, power):
+        """
+        (I + sum_j (theta_j^power - 1) u_j u_j^T) v
+        """
+        M = self.coeffs @ torch.diag(self.theta**power - 1) @ self.coeffs.T
+        a = torch.tensor([dot(s.float(), v) for s in self.basis], dtype=torch.float64)
+        out = v.detach().clone()
+        for b, s in zip((M @ a).tolist(), self.basis, strict=True):
+            out.add_(s.float(), alpha=b)
+        return out
+
+    def sqrt(self, v):
+        """
+        P^1/2 v, differentiable.
+        """
+        return SymmetricOperator.apply(v, lambda x: self.apply(x, -0.5))
+
+    def inv_sqrt(self, v):
+        return self.apply(v, 0.5)
+
+
+class CurvaturePairs:
+    """
+    Ring buffer of the latest ``capacity`` curvature pairs (s, y = A s) of a
+    Hessian A, carried across DA cycles. Vectors are stored normalized in
+    float16 with their norm in float32, which halves the memory of a field
+    and keeps y, scaled by the Hessian, within the float16 range.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.pairs = []
+        self.pos = 0
+
+    def __len__(self):
+        return len(self.pairs)
+
+    @staticmethod
+    def pack(x):
+        norm = torch.linalg.vector_norm(x).item()
+        return (x / norm).to(torch.float16), norm
+
+    def push(self, s, y):
+        s, y = s.detach().float(), y.detach().float()
+        # only pairs of positive curvature carry information on A
+        if not dot(s, y) > 0:
+            return
+        pair = (self.pack(s), self.pack(y))
+        if len(self.pairs) < self.capacity:
+            self.pairs.append(pair)
+        else:
+            self.pairs[self.pos] = pair
+        self.pos = (self.pos + 1) % self.capacity
+
+    def preconditioner(self, rtol=1e-6):
+        """
+        Rayleigh-Ritz on the span of the stored steps: with S the normalized
+        steps and A S known from the y, solve S^T A S c = theta S^T S c and
+        return the SpectralPreconditioner of the Ritz pairs with theta > 1
+        (None if there are none). Nearly dependent steps are dropped through
+        the eigenvalues of the Gram matrix S^T S below ``rtol`` times the
+        largest one.
+        """
+        if not self.pairs:
+            return None
+        basis = [s for (s, _), _ in self.pairs]
+        m = len(basis)
+        G = torch.zeros(m, m, dtype=torch.float64)
+        AS = torch.zeros(m, m, dtype=torch.float64)
+        for j, ((_, s_norm), (y, y_norm)) in enumerate(self.pairs):
+            sj = basis[j].float()
+            Ay = y.float() * (y_norm / s_norm)
+            for i in range(m):
+                si = basis[i].float()
+                G[i, j] = dot(si, sj)
+                AS[i, j] = dot(si, Ay)
+        AS = (AS + AS.T) / 2
+
+        lam, V = torch.linalg.eigh(G)
+        keep = lam > rtol * lam[-1]
+        W = V[:, keep] / torch.sqrt(lam[keep])
+        theta, Z = torch.linalg.eigh(W.T @ AS @ W)
+        keep = theta > 1
+        if not keep.any():
+            return None
+        return SpectralPreconditioner(basis, (W @ Z)[:, keep], theta[keep])
+
+
+MINIMIZERS = {
+    "lbfgs": LBFGSMinimizer,
+    "cg": CGMinimizer,
+    "lanczos": LanczosMinimizer,
+}
+
+
+def build_minimizer(name, w, **kwargs):
+    try:
+        minimizer = MINIMIZERS[name]
+    except KeyError:
+        raise NotImplementedError("Invalid minimizer type.") from None
+    return minimizer(w, **kwargs)
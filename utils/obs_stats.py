@@ -0,0 +1,39 @@
+import torch
+
+
+def obs_space_stats(fields, yo, H, R, nband):
+    """
+    Statistics of the departures yo - x at the observed points only, per
+    channel and latitude band, in one vectorized pass over the points of the
+    mask.
+
+    fields:    dict name -> x, C x H x W normalized fields, e.g. background
+               and analysis
+    yo, H, R:  C x H x W normalized observations, mask and error variances
+    nband:     number of latitude bands of equal numbers of rows
+
+    Returns a dict of C x nband tensors: "count" and, for each name, the mean
+    and rms of yo - x and chi2, the mean of (yo - x)^2 / R (about 1 for
+    departures consistent with R alone).
+    """
+    C, nlat, nlon = yo.shape
+    points = torch.nonzero(H.flatten() > 0).squeeze(1)
+    channel = points // (nlat * nlon)
+    band = (points // nlon) % nlat * nband // nlat
+    group = channel * nband + band
+    n = C * nband
+
+    count = torch.bincount(group, minlength=n).double()
+    norm = count.clamp(min=1)
+    yo_obs = yo.flatten()[points].double()
+    r_obs = R.flatten()[points].double()
+    stats = {"count": count.reshape(C, nband)}
+    for name, x in fields.items():
+        d = yo_obs - x.flatten()[points].double()
+        s1 = torch.bincount(group, weights=d, minlength=n)
+        s2 = torch.bincount(group, weights=d**2, minlength=n)
+        sr = torch.bincount(group, weights=d**2 / r_obs, minlength=n)
+        stats[f"{name}_mean"] = (s1 / norm).reshape(C, nband)
+        stats[f"{name}_rms"] = torch.sqrt(s2 / norm).reshape(C, nband)
+        stats[f"{name}_chi2"] = (sr / norm).reshape(C, nband)
+    return stats
@@ -0,0 +1,165 @@
+import json
+import os
+
+import numpy as np
+
+from utils.columnar import ColumnarLog
+
+# columns of a row besides the scores
+KEYS = {"cycle": "<i8", "kind": "<i1", "region": "<i1", "channel": "<i2"}
+
+
+class ScoreStore:
+    """
+    Streaming store of the per-cycle verification scores.
+
+    Every record, the scores of one field of one cycle, is appended to a
+    ColumnarLog with one row per region and channel; running means and
+    variances of each score (Welford) are updated with it, so the aggregates
+    never reread the history. They are rebuilt from the log when the store is
+    opened.
+    """
+
+    def __init__(
+        self,
+        directory,
+        nchannel,
+        kinds=("bg", "ana"),
+        regions=("all", "northern", "southern", "tropics"),
+        metrics=("wrmse", "bias", "mse", "mae"),
+    ):
+        """
+        Initialization.
+
+        Parameters
+        ----------
+
+        directory: str, required, the directory of the log;
+
+        nchannel: int, required, number of channels of the scores;
+
+        kinds: tuple of str, optional, the fields scored every cycle;
+
+        regions: tuple of str, optional, the regions of the scores;
+
+        metrics: tuple of str, optional, the scores recorded.
+        """
+        self.nchannel = nchannel
+        self.kinds = kinds
+        self.regions = regions
+        self.metrics = metrics
+        self.log = ColumnarLog(
+            directory,
+            {**KEYS, **{name: "<f4" for name in metrics}},
+        )
+        self.region_index = np.repeat(np.arange(len(regions)), nchannel)
+        self.channel_index = np.tile(np.arange(nchannel), len(regions))
+        self.rebuild()
+
+    @staticmethod
+    def recorded_metrics(directory):
+        """
+        Returns the metrics of the log in ``directory``, None if there is none.
+        """
+        path = os.path.join(directory, "schema.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return tuple(name for name in json.load(f) if name not in KEYS)
+
+    def rebuild(self):
+        """
+        Recompute the row count and the running statistics from the log.
+        """
+        data = ColumnarLog.read(self.log.directory)
+        # whole records only, an interrupted append is dropped
+        record = len(self.regions) * self.nchannel
+        self.nrows = len(data["cycle"]) // record * record
+        if self.nrows < len(data["cycle"]):
+            self.log.truncate(self.nrows)
+            data = {name: values[: self.nrows] for name, values in data.items()}
+        shape = (len(self.kinds), len(self.metrics), len(self.regions), self.nchannel)
+        self.count = np.zeros(len(self.kinds), dtype=np.int64)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        for k in range(len(self.kinds)):
+            rows = data["kind"] == k
+            if not rows.any():
+                continue
+            samples = np.stack(
+                [
+                    data[name][rows].reshape(-1, len(self.regions), self.nchannel)
+                    for name in self.metrics
+                ],
+                1,
+            ).astype(np.float64)  # N x metric x region x channel
+            self.count[k] = len(samples)
+            self.mean[k] = samples.mean(0)
+            self.m2[k] = ((samples - self.mean[k]) ** 2).sum(0)
+
+    def record(self, kind, cycle, scores):
+        """
+        Append the scores of a cycle.
+
+        kind:    one of ``kinds``
+        cycle:   cycle time in ns
+        scores:  dict metric -> region x channel tensor or array, e.g. from
+                 utils.metrics.fused_scores
+        """
+        k = self.kinds.index(kind)
+        x = np.stack(
+            [np.asarray(scores[name], dtype=np.float64) for name in self.metrics], 0
+        ).reshape(len(self.metrics), len(self.regions), self.nchannel)
+        n = len(self.region_index)
+        self.log.append(
+            cycle=np.full(n, cycle),
+            kind=np.full(n, k),
+            region=self.region_index,
+            channel=self.channel_index,
+            **{name: x[i].reshape(-1) for i, name in enumerate(self.metrics)},
+        )
+        self.nrows += n
+
+        self.count[k] += 1
+        delta = x - self.mean[k]
+        self.mean[k] += delta / self.count[k]
+        self.m2[k] += delta * (x - self.mean[k])
+
+    def truncate(self, nrows):
+        """
+        Keep the first ``nrows`` rows of the log, e.g. those of the cycles
+        before the checkpoint a run resumes from.
+        """
+        self.log.truncate(nrows)
+        self.rebuild()
+
+    def rewind(self, cycle):
+        """
+        Drop the records of ``cycle`` (ns) and later, e.g. when a run resumes
+        at ``cycle``.
+        """
+        data = ColumnarLog.read(self.log.directory)
+        self.truncate(int((data["cycle"][: self.nrows] < cycle).sum()))
+
+    def summary(self, kind):
+        """
+        Returns the number of cycles and a dict metric -> (mean, std), each of
+        size region x channel, of the scores recorded under ``kind``.
+        """
+        k = self.kinds.index(kind)
+        n = self.count[k]
+        std = np.sqrt(self.m2[k] / max(n - 1, 1))
+        return n, {
+            name: (self.mean[k, i], std[i]) for i, name in enumerate(self.metrics)
+        }
+
+    def history(self, kind, metric):
+        """
+        Returns the cycle times (ns) and the scores of ``metric`` of every
+        cycle, cycle x region x channel, read back from the log.
+        """
+        data = ColumnarLog.read(self.log.directory)
+        rows = data["kind"] == self.kinds.index(kind)
+        values = data[metric][rows].reshape(-1, len(self.regions), self.nchannel)
+        cycles = data["cycle"][rows][:: len(self.regions) * self.nchannel]
+        return cycles, values
@@ -0,0 +1,133 @@
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class MinimizationTelemetry:
+    """
+    Structured telemetry of the cost function evaluations of a DA cycle,
+    appended as JSON lines:
+
+        - "eval": one line per closure evaluation;
+
+        - "iter": one line per outer minimizer step;
+
+        - "cycle": one summary line per cycle.
+
+    Wall time is split into named sections with ``timer``; ``count`` keeps
+    counters such as the number of model calls. Sections and counters are
+    reported both per evaluation and summed over the cycle.
+
+    Records written while ``tag`` is set carry it as "run", e.g. the float32
+    rerun of a cycle by --precision_check, so they are not mistaken for the
+    records of the cycle itself.
+    """
+
+    def __init__(self, path):
+        """
+        Initialization.
+
+        Parameters
+        ----------
+
+        path: str, required, the JSONL file, appended to across restarts; see
+        ``rewind``.
+        """
+        self.path = path
+        self.tag = None
+        self.cycle = None
+        self.eval_times = defaultdict(float)
+        self.eval_counts = defaultdict(int)
+        self.cycle_times = defaultdict(float)
+        self.cycle_counts = defaultdict(int)
+        self.evals = []
+
+    def write(self, record):
+        if self.tag is not None:
+            record = {**record, "run": self.tag}
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def rewind(self, cycle):
+        """
+        Drop the records of ``cycle`` and later, e.g. the cycles run again
+        after a resume, and a last line cut short by an interruption.
+        """
+        if not os.path.exists(self.path):
+            return
+        kept = []
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                # cycles are written as "YYYY-MM-DD HH:MM:SS", in time order
+                if record["cycle"] < str(cycle):
+                    kept.append(line)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            f.writelines(kept)
+        os.replace(tmp, self.path)
+
+    def start_cycle(self, cycle):
+        self.cycle = str(cycle)
+        self.cycle_clock = time.time()
+        self.cycle_times.clear()
+        self.cycle_counts.clear()
+        self.evals = []
+        self.start_evaluation()
+
+    def start_evaluation(self):
+        self.eval_clock = time.time()
+        self.eval_times.clear()
+        self.eval_counts.clear()
+
+    @contextmanager
+    def timer(self, name):
+        clock = time.time()
+        try:
+            yield
+        finally:
+            elapsed = time.time() - clock
+            self.eval_times[name] += elapsed
+            self.cycle_times[name] += elapsed
+
+    def count(self, name, n=1):
+        self.eval_counts[name] += n
+        self.cycle_counts[name] += n
+
+    def log_evaluation(self, **fields):
+        record = {
+            "type": "eval",
+            "cycle": self.cycle,
+            "eval": len(self.evals),
+            **fields,
+            **{"n_" + k: v for k, v in self.eval_counts.items()},
+            **{"time_" + k: v for k, v in self.eval_times.items()},
+            "time_total": time.time() - self.eval_clock,
+        }
+        self.evals.append(record)
+        self.write(record)
+
+    def log_iteration(self, **fields):
+        self.write({"type": "iter", "cycle": self.cycle, **fields})
+
+    def end_cycle(self, **fields):
+        record = {
+            "type": "cycle",
+            "cycle": self.cycle,
+            "n_eval": len(self.evals),
+            **fields,
+        }
+        if self.evals:
+            for key in ("cost", "grad_norm"):
+                record[key + "_first"] = self.evals[0].get(key)
+                record[key + "_last"] = self.evals[-1].get(key)
+        record.update({"n_" + k: v for k, v in self.cycle_counts.items()})
+        record.update({"time_" + k: v for k, v in self.cycle_times.items()})
+        record["time_total"] = time.time() - self.cycle_clock
+        self.write(record)
+        return record
@@ -0,0 +1,121 @@
+import queue
+import threading
+
+from utils.metrics import REGIONS, fused_scores
+
+
+class VerificationWorker:
+    """
+    Scores the background and the analysis of each cycle against the truth
+    in a background thread and records them in a ScoreStore, so verification
+    is off the critical path of the assimilation.
+
+    ``submit`` queues the fields of a cycle and returns; the queue holds at
+    most ``maxsize`` cycles, which blocks the caller if verification falls
+    behind. The fields must not be modified in place after ``submit``.
+    ``flush`` waits until every submitted cycle is recorded.
+    """
+
+    def __init__(
+        self, scores, mean, std, regions=REGIONS, maxsize=2, maps=None, climatology=None
+    ):
+        """
+        Initialization.
+
+        Parameters
+        ----------
+
+        scores: ScoreStore, required, where the scores are recorded;
+
+        mean, std: tensor, required, C x 1 x 1 normalization of the fields;
+
+        regions: tuple of str, optional, the regions scored;
+
+        maxsize: int, optional, number of cycles queued at most;
+
+        maps: ErrorMaps, optional, per-gridpoint error statistics also
+        accumulated every cycle;
+
+        climatology: Climatology, optional, adds the activity and ACC scores.
+        """
+        self.scores = scores
+        self.mean = mean
+        self.std = std
+        self.regions = regions
+        self.maps = maps
+        self.climatology = climatology
+        self.error = None
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is not None:
+                    self.verify(*item)
+            except Exception as e:  # reported by submit / flush / close
+                self.error = e
+            finally:
+                self.queue.task_done()
+            if item is None:
+                return
+
+    def verify(self, cycle, xb, xa, gt):
+        gt_norm = (gt - self.mean) / self.std
+        clim_norm = None
+        if self.climatology is not None:
+            clim = self.climatology.get(cycle).to(gt.device)
+            clim_norm = (clim - self.mean) / self.std
+        idx = 11
+        for kind, x in (("bg", xb), ("ana", xa)):
+            scores = fused_scores(
+                (x - self.mean) / self.std,
+                gt_norm,
+                clim_mean=clim_norm,
+                data_std=self.std.reshape(-1).double(),
+                regions=self.regions,
+            )
+            self.scores.record(kind, cycle.value, scores)
+            if self.maps is not None:
+                self.maps.update(kind, cycle.value, x, gt)
+            line = "%s %s: MSE (total): %.4g RMSE (z500): %.4g Bias (z500): %.4g" % (
+                cycle,
+                kind,
+                scores["mse"][0].mean().item(),
+                scores["wrmse"][0, idx].item(),
+                scores["bias"][0, idx].item(),
+            )
+            if "acc" in scores:
+                line += " ACC (z500): %.4g" % scores["acc"][0, idx].item()
+            print(line, flush=True)
+
+    def check(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError("verification worker failed") from error
+
+    def submit(self, cycle, xb, xa, gt):
+        """
+        cycle:       cycle time (pd.Timestamp)
+        xb, xa, gt:  C x H x W background, analysis and truth, in physical
+                     units
+        """
+        self.check()
+        self.queue.put((cycle, xb.detach(), xa.detach(), gt.detach()))
+
+    def flush(self):
+        """
+        Wait for the queued cycles and the one in progress to be recorded.
+        """
+        self.queue.join()
+        self.check()
+
+    def close(self):
+        """
+        Wait for the queued cycles to be scored and stop the worker.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        self.check()
@@ -0,0 +1,178 @@
+import argparse
+import glob
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import torch
+
+from cyclic_da import data_reader, shared_resources
+from utils.climatology import Climatology
+from utils.metrics import MetricsRecorder
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="score the fields saved with --save_field against ERA5"
+    )
+    parser.add_argument(
+        "experiments",
+        type=str,
+        nargs="+",
+        help="experiment directories, e.g. da_cycle_results/<name>",
+    )
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        default="WRMSE,Bias,Channel_MSE",
+        help="comma-separated Metrics names, e.g. WRMSE,NWRMSE,WACC",
+    )
+    parser.add_argument(
+        "--climatology",
+        type=str,
+        default="",
+        help="climatology built by build_climatology.py, needed by the ACC, "
+        "Anomaly and Activity metrics ('': none)",
+    )
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument(
+        "--max_in_flight",
+        type=int,
+        default=0,
+        help="cycles queued to the workers at once (0: twice the workers)",
+    )
+    parser.add_argument(
+        "--backend", type=str, default="torch", choices=["torch", "numba"]
+    )
+    parser.add_argument(
+        "--chunk",
+        type=int,
+        default=0,
+        help="channels per-channel metrics are evaluated at once (0: all)",
+    )
+    parser.add_argument(
+        "--cache_gb",
+        type=float,
+        default=8.0,
+        help="memory cap of the ERA5 states cached for all experiments",
+    )
+    parser.add_argument("--out", type=str, default="verify.csv")
+    return parser.parse_args()
+
+
+def saved_cycles(directory):
+    """
+    Cycle times of the experiment with both xb_<time>.npy and xa_<time>.npy.
+    """
+    cycles = []
+    for path in glob.glob(os.path.join(directory, "xb_*.npy")):
+        stamp = os.path.basename(path)[3:-4]
+        if os.path.exists(os.path.join(directory, f"xa_{stamp}.npy")):
+            cycles.append(pd.Timestamp(stamp))
+    return sorted(cycles)
+
+
+def score_cycle(directory, cycle, gt, clim, mean, std, metrics, backend, chunk):
+    """
+    Scores of the background and the analysis of one cycle, in a worker
+    process; the fields are read here, the truth and climatology are passed
+    in shared memory.
+
+    Returns a dict kind -> dict of the scores, see MetricsRecorder.as_dict.
+    """
+    recorder = MetricsRecorder(metrics, chunk=chunk, backend=backend)
+    data = {"gt": ((gt - mean) / std)[None], "std": std.reshape(-1)}
+    if clim is not None:
+        data["clim_mean"] = (clim - mean) / std
+    scores = {}
+    for kind, prefix in (("bg", "xb"), ("ana", "xa")):
+        x = torch.from_numpy(np.load(os.path.join(directory, f"{prefix}_{cycle}.npy")))
+        data["pred"] = ((x - mean) / std)[None]
+        scores[kind] = recorder.as_dict(recorder.evaluate_batch(data))
+    return scores
+
+
+def verify(args):
+    """
+    Score every saved cycle of the experiments in worker processes, cycle by
+    cycle in time order, so experiments over the same period share each ERA5
+    state through the cache. The truth of a cycle is read while the workers
+    score the previous ones; at most ``max_in_flight`` cycles are queued.
+    """
+    metrics = args.metrics.split(",")
+    mean = torch.from_numpy(np.load("dataset/layer_mean.npy")).float()
+    std = torch.from_numpy(np.load("dataset/layer_std.npy")).float()
+    step = pd.Timedelta(hours=6)
+    reader = data_reader(
+        obs_type=None,
+        obs_std=0.0,
+        model_std=std,
+        da_win=1,
+        cycle_time=step,
+        step_int_time=step,
+        shared=shared_resources(int(args.cache_gb * 2**30)),
+    )
+    clim = Climatology(args.climatology) if args.climatology else None
+    mean = mean.reshape(-1, 1, 1)
+    std = std.reshape(-1, 1, 1)
+
+    tasks = sorted(
+        (cycle, directory)
+        for directory in args.experiments
+        for cycle in saved_cycles(directory)
+    )
+    max_in_flight = args.max_in_flight or 2 * args.workers
+    rows = []
+    with ProcessPoolExecutor(
+        args.workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=torch.set_num_threads,
+        initargs=(max(1, os.cpu_count() // args.workers),),
+    ) as pool:
+        queued = deque()
+
+        def collect():
+            cycle, directory, future = queued.popleft()
+            for kind, scores in future.result().items():
+                rows.append(
+                    {"experiment": directory, "cycle": cycle, "kind": kind, **scores}
+                )
+
+        for cycle, directory in tasks:
+            gt = reader.get_state(cycle)
+            clim_t = clim.get(cycle) if clim is not None else None
+            future = pool.submit(
+                score_cycle,
+                directory,
+                cycle,
+                gt,
+                clim_t,
+                mean,
+                std,
+                metrics,
+                args.backend,
+                args.chunk,
+            )
+            queued.append((cycle, directory, future))
+            if len(queued) >= max_in_flight:
+                collect()
+        while queued:
+            collect()
+
+    table = pd.DataFrame(rows)
+    table.to_csv(args.out, index=False)
+    for directory in args.experiments:
+        n = (table["experiment"] == directory).sum() // 2 if len(table) else 0
+        print("%s: %d cycles scored" % (directory, n))
+    print(
+        "state cache: %d hits, %d misses"
+        % (reader.shared.states.hits, reader.shared.states.misses)
+    )
+    print("scores written to %s" % args.out, flush=True)
+
+
+if __name__ == "__main__":
+    verify(parse_args())